@@ -0,0 +1,94 @@
+import os
+import re
+
+
+# Token budget for the conversation section of the follow-up prompt
+FOLLOWUP_HISTORY_TOKEN_BUDGET = int(os.getenv("FOLLOWUP_HISTORY_TOKEN_BUDGET", "400"))
+# Older questions/answers are squeezed to this many characters when they get summarized
+SUMMARY_CHARS = 40
+
+
+def estimate_tokens(text):
+    # Gemini tokenizes English at roughly 4 characters per token; close enough for budgeting
+    return max(1, len(text) // 4)
+
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", str(text)).strip()
+
+
+class ConversationContext:
+    """
+    Compact Q/A view of a follow-up `chat_history` ([{"bot": q}, {"user": a}, ...]).
+
+    Repeated questions are de-duplicated (the latest answer wins) and `render`
+    keeps the most recent turns verbatim while older ones collapse into a short
+    summary line once the token budget is exceeded.
+    """
+
+    def __init__(self, chat_history):
+        turns = []  # [question, answer or None]
+        for entry in chat_history:
+            if "bot" in entry:
+                turns.append([_normalize(entry["bot"]), None])
+            elif "user" in entry:
+                answer = _normalize(entry["user"])
+                if turns and turns[-1][1] is None:
+                    turns[-1][1] = answer
+                else:
+                    turns.append([None, answer])
+
+        # A question asked twice only keeps its latest occurrence
+        seen = set()
+        self.turns = []
+        for question, answer in reversed(turns):
+            key = question.lower() if question is not None else None
+            if key is not None:
+                if key in seen:
+                    continue
+                seen.add(key)
+            self.turns.insert(0, [question, answer])
+
+    @staticmethod
+    def _render_turn(number, question, answer):
+        lines = []
+        if question is not None:
+            lines.append(f"Q{number}: {question}")
+        lines.append(f"A{number}: {answer if answer is not None else '(awaiting answer)'}")
+        return "\n".join(lines)
+
+    def render(self, budget_tokens=FOLLOWUP_HISTORY_TOKEN_BUDGET):
+        if not self.turns:
+            return "(no follow-up questions asked yet)"
+
+        rendered = [self._render_turn(i + 1, q, a) for i, (q, a) in enumerate(self.turns)]
+        kept = []
+        used = 0
+        # Walk back from the latest turn; always keep at least the last one verbatim
+        for text in reversed(rendered):
+            cost = estimate_tokens(text)
+            if kept and used + cost > budget_tokens:
+                break
+            kept.insert(0, text)
+            used += cost
+
+        older = len(rendered) - len(kept)
+        if older == 0:
+            return "\n".join(kept)
+
+        facts = []
+        for question, answer in self.turns[:older]:
+            if answer is None:
+                continue
+            if question is not None:
+                facts.append(f"{question[:SUMMARY_CHARS]} -> {answer[:SUMMARY_CHARS]}")
+            else:
+                facts.append(answer[:SUMMARY_CHARS])
+        summary = f"Earlier answers (Q1-Q{older}): " + "; ".join(facts)
+        # If even the summary doesn't fit, drop its oldest facts first
+        while facts and used + estimate_tokens(summary) > budget_tokens:
+            facts.pop(0)
+            summary = f"Earlier answers (Q1-Q{older}, oldest omitted): " + "; ".join(facts)
+        if facts:
+            kept.insert(0, summary)
+        return "\n".join(kept)
@@ -0,0 +1,131 @@
+import asyncio
+import os
+
+from Followup_Generation.followup import get_followup_for_diagnosis
+from Followup_Generation.rules import followup_rules
+from llm_gateway.admission import llm_priority, PRIORITY_SPECULATIVE
+
+
+FOLLOWUP_PREFETCH = os.getenv("FOLLOWUP_PREFETCH", "0") == "1"
+# Max speculative LLM calls in flight across all sessions on this worker
+PREFETCH_MAX_CONCURRENCY = int(os.getenv("PREFETCH_MAX_CONCURRENCY", "8"))
+# Max speculative calls per session, so one long consultation can't burn the budget
+PREFETCH_MAX_CALLS_PER_SESSION = int(os.getenv("PREFETCH_MAX_CALLS_PER_SESSION", "24"))
+
+OPTION_KEYS = ["A", "B", "C", "D"]
+
+
+class FollowupPrefetcher:
+    """
+    While the patient reads an MCQ question, generates the next follow-up for
+    every option in parallel. When the answer arrives the matching result is
+    used (awaited if still running) and the other branches are cancelled.
+
+    Speculative calls are bounded by a global concurrency limit and a per-session
+    call budget; when either is exhausted the turn falls back to a normal call.
+    """
+
+    def __init__(self, enabled=FOLLOWUP_PREFETCH, max_concurrency=PREFETCH_MAX_CONCURRENCY,
+                 max_calls_per_session=PREFETCH_MAX_CALLS_PER_SESSION):
+        self.enabled = enabled
+        self.max_concurrency = max_concurrency
+        self.max_calls_per_session = max_calls_per_session
+        self._pending = {}  # session_id -> {option key: (task, prompt token log)}
+        self._calls_per_session = {}
+        self._inflight = 0
+        self.counters = {"turns": 0, "hits": 0, "misses": 0, "speculative_calls": 0, "wasted_calls": 0,
+                         "skipped_budget": 0}
+
+    def prefetch(self, session_id, age, gender, symptoms, chat_history, question):
+        """Starts generating the next follow-up for each option of `question`."""
+        self.cancel(session_id)
+        if not self.enabled:
+            return
+        # Branches the rule table will answer locally don't need an LLM call
+        options = [
+            key for key in OPTION_KEYS
+            if key in question and followup_rules.peek(symptoms, chat_history + [{"user": question[key]}]) is None
+        ]
+        if not options:
+            return
+        used = self._calls_per_session.get(session_id, 0)
+        if (self._inflight + len(options) > self.max_concurrency
+                or used + len(options) > self.max_calls_per_session):
+            self.counters["skipped_budget"] += 1
+            return
+
+        tasks = {}
+        for key in options:
+            # Each branch sees the history as it will look once this option is chosen
+            history = chat_history + [{"user": question[key]}]
+            token_log = []
+            task = asyncio.create_task(self._speculate(age, gender, symptoms, history, token_log))
+            task.add_done_callback(self._release)
+            tasks[key] = (task, token_log)
+        self._inflight += len(tasks)
+        self._pending[session_id] = tasks
+        self._calls_per_session[session_id] = used + len(tasks)
+        self.counters["speculative_calls"] += len(tasks)
+
+    @staticmethod
+    async def _speculate(age, gender, symptoms, history, token_log):
+        # Runs in the task's own context copy, so this doesn't leak to the caller
+        llm_priority.set(PRIORITY_SPECULATIVE)
+        return await get_followup_for_diagnosis(age, gender, symptoms, history, token_log=token_log)
+
+    def _release(self, task):
+        self._inflight -= 1
+
+    async def next_followup(self, session_id, answer_key, age, gender, symptoms, chat_history, token_log=None):
+        """
+        Returns the follow-up for the given answer, from the prefetched branch if
+        there is one, otherwise from a regular call. Unused branches are cancelled.
+        `token_log` is passed through to get_followup_for_diagnosis.
+        """
+        self.counters["turns"] += 1
+        tasks = self._pending.pop(session_id, {})
+        branch = tasks.pop(answer_key, None)
+        self._discard(tasks)
+
+        if branch is not None:
+            task, branch_log = branch
+            try:
+                response = await task
+            except Exception as e:
+                print(f"Prefetched follow-up failed for session {session_id}: {e}")
+                response = None
+            if response is not None:
+                self.counters["hits"] += 1
+                if token_log is not None:
+                    token_log.extend(branch_log)
+                return response
+
+        self.counters["misses"] += 1
+        return await get_followup_for_diagnosis(age, gender, symptoms, chat_history, token_log=token_log)
+
+    def cancel(self, session_id):
+        self._discard(self._pending.pop(session_id, {}))
+
+    def end_session(self, session_id):
+        self.cancel(session_id)
+        self._calls_per_session.pop(session_id, None)
+
+    def _discard(self, tasks):
+        for task, _ in tasks.values():
+            # Completed or not, a branch nobody uses was a wasted LLM call
+            self.counters["wasted_calls"] += 1
+            task.cancel()
+
+    def stats(self):
+        turns = self.counters["turns"]
+        speculative = self.counters["speculative_calls"]
+        return {
+            **self.counters,
+            "enabled": self.enabled,
+            "in_flight": self._inflight,
+            "hit_rate": round(self.counters["hits"] / turns, 4) if turns else 0.0,
+            "wasted_call_ratio": round(self.counters["wasted_calls"] / speculative, 4) if speculative else 0.0,
+        }
+
+
+followup_prefetcher = FollowupPrefetcher()
@@ -0,0 +1,114 @@
+import json
+import os
+import re
+
+
+QUESTION_TABLE_PATH = os.getenv(
+    "FOLLOWUP_QUESTION_TABLE", os.path.join(os.path.dirname(__file__), "question_table.json")
+)
+# How many opening questions the table may ask before the LLM takes over
+RULES_MAX_LOCAL_QUESTIONS = int(os.getenv("RULES_MAX_LOCAL_QUESTIONS", "2"))
+
+READY_FOR_DIAGNOSIS = "Ready for diagnosis"
+
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", str(text)).strip().lower()
+
+
+class FollowupRules:
+    """
+    Local fast path for follow-up turns, backed by a symptom -> question table.
+
+    It asks the common opening questions (onset, severity, fever, a
+    symptom-specific one) and stops immediately when an answer is a red flag,
+    without calling the LLM. When the table has no confident answer, `answer`
+    returns None and the caller hands off to get_followup_for_diagnosis.
+    """
+
+    def __init__(self, path=QUESTION_TABLE_PATH, max_local_questions=RULES_MAX_LOCAL_QUESTIONS):
+        self.path = path
+        self.max_local_questions = max_local_questions
+        self.loaded = False
+        self.counters = {"turns": 0, "local_questions": 0, "local_stops": 0, "handoffs": 0}
+
+    def load(self):
+        with open(self.path, encoding="utf-8") as f:
+            table = json.load(f)
+        self.questions = table["questions"]
+        self.plans = {_normalize(symptom): ids for symptom, ids in table["symptoms"].items()}
+        self.default_plan = table["default"]
+        self.stop_answers = {_normalize(answer) for answer in table["stop_answers"]}
+        self.local_question_texts = {_normalize(q["Question"]) for q in self.questions.values()}
+        # Longest names first so "chest pain" wins over "pain"-like partial matches
+        self._symptom_patterns = [
+            (name, re.compile(r"\b" + re.escape(name) + r"\b"))
+            for name in sorted(self.plans, key=len, reverse=True)
+        ]
+        self.loaded = True
+
+    def _matched_symptoms(self, symptoms):
+        matched = []
+        for term in sorted(_normalize(s) for s in symptoms):
+            for name, pattern in self._symptom_patterns:
+                if pattern.search(term) and name not in matched:
+                    matched.append(name)
+                    break
+        return matched
+
+    def _plan(self, symptoms):
+        matched = self._matched_symptoms(symptoms)
+        plan = []
+        for name in matched:
+            for question_id in self.plans[name]:
+                if question_id not in plan:
+                    plan.append(question_id)
+        if not matched:
+            # Nothing recognised: only the universal onset question is a safe bet
+            plan = self.default_plan[:1]
+        if "fever" in matched and "fever" in plan:
+            plan.remove("fever")
+        return plan
+
+    def peek(self, symptoms, chat_history):
+        """
+        Returns a question dict, READY_FOR_DIAGNOSIS, or None (hand off to the
+        LLM) for the next turn, without touching the counters.
+        """
+        if not self.loaded:
+            self.load()
+
+        answers = [_normalize(entry["user"]) for entry in chat_history if "user" in entry]
+        if any(answer in self.stop_answers for answer in answers):
+            return READY_FOR_DIAGNOSIS
+
+        asked = [_normalize(entry["bot"]) for entry in chat_history if "bot" in entry]
+        # Once the LLM has asked something, keep the conversation with it
+        if len(asked) >= self.max_local_questions or any(q not in self.local_question_texts for q in asked):
+            return None
+
+        for question_id in self._plan(symptoms):
+            question = self.questions[question_id]
+            if _normalize(question["Question"]) not in asked:
+                return dict(question)
+        return None
+
+    def answer(self, symptoms, chat_history):
+        """Like `peek`, but records whether the turn was served locally."""
+        result = self.peek(symptoms, chat_history)
+        self.counters["turns"] += 1
+        if result is None:
+            self.counters["handoffs"] += 1
+        elif result == READY_FOR_DIAGNOSIS:
+            self.counters["local_stops"] += 1
+        else:
+            self.counters["local_questions"] += 1
+        return result
+
+    def stats(self):
+        turns = self.counters["turns"]
+        local = self.counters["local_questions"] + self.counters["local_stops"]
+        return {**self.counters, "local_fraction": round(local / turns, 4) if turns else 0.0}
+
+
+followup_rules = FollowupRules()
@@ -0,0 +1,42 @@
+"""
+Runs a file of intake records through extraction, mapping and the final
+report, appending results to a JSONL file. Re-running with the same output
+file resumes: records already written successfully are skipped.
+
+    python -m batch_consultation.cli intakes.jsonl results.jsonl [--pdf-dir pdfs] \\
+        [--concurrency 8] [--ner-batch-size 64]
+
+Input is JSONL or CSV (by extension) with a `symptoms` text per record and
+optional `id`, `name`, `age` and `gender`.
+"""
+import argparse
+import asyncio
+import json
+
+import helper_functions.config  # reads .env before any module looks up its settings
+from batch_consultation.runner import run_batch, BATCH_CONCURRENCY, BATCH_NER_SIZE
+from symptom_processing.extraction_service import extraction_service
+
+
+async def _run(args):
+    await extraction_service.start(warm=False)
+    try:
+        return await run_batch(args.input, args.output, args.pdf_dir, args.concurrency, args.ner_batch_size)
+    finally:
+        await extraction_service.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input", help="JSONL or CSV file of intake records")
+    parser.add_argument("output", help="JSONL results file, also used as the resume checkpoint")
+    parser.add_argument("--pdf-dir", help="also write one PDF report per record here")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--ner-batch-size", type=int, default=BATCH_NER_SIZE)
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(_run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import re
+import time
+
+from diagnosis_report.report import final_report
+from helper_functions.helper import render_pdf
+from llm_gateway.admission import AdmissionRejected, llm_priority, PRIORITY_BATCH
+from symptom_mapping.mapping import get_disease_symptom_mapping
+from symptom_processing.extraction_service import extraction_service
+from symptom_processing.symptom import hybrid_symptom_extraction_async
+
+
+# Records whose LLM stages may run at the same time
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+# Upper bound for a job's own concurrency, whatever the request asks for
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))
+# Intake texts per nlp.pipe call
+BATCH_NER_SIZE = int(os.getenv("BATCH_NER_SIZE", "64"))
+# Batch jobs can afford to wait for the LLM symptom extraction much longer than /symptom
+BATCH_LLM_EXTRACTION_TIMEOUT_SECONDS = float(os.getenv("BATCH_LLM_EXTRACTION_TIMEOUT_SECONDS", "60"))
+BATCH_MAX_ADMISSION_RETRIES = int(os.getenv("BATCH_MAX_ADMISSION_RETRIES", "20"))
+
+
+def read_records(path):
+    """
+    Streams intake records from a JSONL or CSV file (by extension). Each record
+    needs `symptoms` (the free-text intake) and may carry `id`, `name`, `age`
+    and `gender`; records without an id are numbered by their position.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for number, row in enumerate(rows, start=1):
+            row = dict(row)
+            row["id"] = str(row.get("id") or number)
+            yield row
+
+
+def completed_ids(output_path):
+    """
+    IDs of records already written successfully to `output_path`. The results
+    file doubles as the checkpoint: a resumed run skips these and retries the
+    ones that failed. A line cut short by a crash is ignored.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            if result.get("status") == "ok":
+                done.add(str(result["id"]))
+    return done
+
+
+_SAFE_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+def pdf_filename(record_id):
+    """
+    File name for a record's PDF. Record ids come from the input, so only
+    plain ones (letters, digits, - and _) are used as they are; anything
+    else, such as a path, is replaced by a hash of the id.
+    """
+    if _SAFE_ID.fullmatch(record_id):
+        return f"{record_id}.pdf"
+    return f"record-{hashlib.sha256(record_id.encode('utf-8')).hexdigest()[:16]}.pdf"
+
+
+def record_error(record):
+    """Why `record` can't be processed, or None when it can."""
+    symptoms = record.get("symptoms")
+    if not isinstance(symptoms, str) or not symptoms.strip():
+        return "record has no symptoms text"
+    return None
+
+
+async def _with_admission_retries(make_call):
+    # Batch calls have the lowest priority, so being turned away is expected under
+    # load: back off for as long as admission control asks instead of failing
+    for attempt in range(BATCH_MAX_ADMISSION_RETRIES + 1):
+        try:
+            return await make_call()
+        except AdmissionRejected as e:
+            if attempt >= BATCH_MAX_ADMISSION_RETRIES:
+                raise
+            await asyncio.sleep(e.retry_after)
+
+
+class BatchRunner:
+    """
+    Runs intake records through symptom extraction, disease mapping and the
+    final report without the websocket follow-up, writing one JSON line per
+    record to `output_path` as soon as it finishes (and a PDF per record to
+    `pdf_dir` when given).
+
+    Input is read lazily, NER runs over chunks of `ner_batch_size` texts in one
+    `nlp.pipe` pass, and at most `concurrency` records are in their LLM stages
+    at once, capped at BATCH_MAX_CONCURRENCY.
+    """
+
+    def __init__(self, output_path, pdf_dir=None, concurrency=BATCH_CONCURRENCY, ner_batch_size=BATCH_NER_SIZE):
+        self.output_path = output_path
+        self.pdf_dir = pdf_dir
+        self.concurrency = min(max(1, concurrency), BATCH_MAX_CONCURRENCY)
+        self.ner_batch_size = max(1, ner_batch_size)
+        self.counters = {"read": 0, "skipped": 0, "ok": 0, "failed": 0}
+        self.started = None
+        self.finished = None
+
+    async def run(self, records):
+        llm_priority.set(PRIORITY_BATCH)
+        self.started = time.time()
+        done = completed_ids(self.output_path)
+        if self.pdf_dir:
+            os.makedirs(self.pdf_dir, exist_ok=True)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        pending = set()
+        with open(self.output_path, "a", encoding="utf-8") as out:
+            chunk = []
+            for record in records:
+                self.counters["read"] += 1
+                if record["id"] in done:
+                    self.counters["skipped"] += 1
+                    continue
+                error = record_error(record)
+                if error is not None:
+                    # Written on its own so one bad record can't fail its whole NER chunk
+                    self.counters["failed"] += 1
+                    self._write(out, {"id": record["id"], "name": record.get("name"), "status": "error",
+                                      "error": error})
+                    continue
+                chunk.append(record)
+                if len(chunk) >= self.ner_batch_size:
+                    pending |= await self._start_chunk(chunk, semaphore, out)
+                    chunk = []
+                    # Don't run ahead of the LLM stages by more than one NER chunk
+                    while len(pending) > self.ner_batch_size:
+                        _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if chunk:
+                pending |= await self._start_chunk(chunk, semaphore, out)
+            if pending:
+                await asyncio.wait(pending)
+
+        self.finished = time.time()
+        return self.stats()
+
+    async def _start_chunk(self, chunk, semaphore, out):
+        try:
+            sci_terms = await extraction_service.extract_many([record["symptoms"] for record in chunk])
+        except Exception as e:
+            print(f"Batch NER failed for {len(chunk)} records, continuing with LLM extraction only: {e}")
+            sci_terms = [[] for _ in chunk]
+        return {
+            asyncio.create_task(self._process(record, terms, semaphore, out))
+            for record, terms in zip(chunk, sci_terms)
+        }
+
+    async def _process(self, record, sci_terms, semaphore, out):
+        result = {"id": record["id"], "name": record.get("name")}
+        async with semaphore:
+            try:
+                age = record.get("age") or "unknown"
+                gender = record.get("gender") or "unknown"
+                symptoms = await _with_admission_retries(lambda: hybrid_symptom_extraction_async(
+                    record["symptoms"], llm_timeout=BATCH_LLM_EXTRACTION_TIMEOUT_SECONDS, sci_terms=sci_terms,
+                    fallback_on_rejection=False,  # a spaCy-only record would count as done and never be retried
+                ))
+                mapped = await _with_admission_retries(
+                    lambda: get_disease_symptom_mapping(age, gender, symptoms, [])
+                )
+                report = await _with_admission_retries(lambda: final_report(age, gender, symptoms, [], mapped))
+                result.update(status="ok", symptoms=symptoms, mapped_diseases=mapped, report=report)
+                if self.pdf_dir:
+                    path = os.path.join(self.pdf_dir, pdf_filename(record["id"]))
+                    pdf_bytes = await asyncio.get_running_loop().run_in_executor(None, render_pdf, report)
+                    with open(path, "wb") as f:
+                        f.write(pdf_bytes)
+                    result["pdf"] = path
+                self.counters["ok"] += 1
+            except Exception as e:
+                print(f"Batch record {record['id']} failed: {e}")
+                result.update(status="error", error=str(e))
+                self.counters["failed"] += 1
+
+        self._write(out, result)
+
+    @staticmethod
+    def _write(out, result):
+        out.write(json.dumps(result) + "\n")
+        out.flush()
+
+    def stats(self):
+        end = self.finished or time.time()
+        elapsed = end - self.started if self.started else 0.0
+        processed = self.counters["ok"] + self.counters["failed"]
+        return {
+            **self.counters,
+            "running": self.started is not None and self.finished is None,
+            "elapsed_seconds": round(elapsed, 2),
+            "records_per_second": round(processed / elapsed, 2) if elapsed else 0.0,
+            "output_path": self.output_path,
+        }
+
+
+async def run_batch(input_path, output_path, pdf_dir=None, concurrency=BATCH_CONCURRENCY,
+                    ner_batch_size=BATCH_NER_SIZE):
+    """Runs every record of `input_path` that `output_path` doesn't already hold."""
+    runner = BatchRunner(output_path, pdf_dir, concurrency, ner_batch_size)
+    return await runner.run(read_records(input_path))
@@ -0,0 +1,84 @@
+"""
+Benchmark for symptom_mapping.disease_index.DiseaseIndex on a synthetic
+10k-disease x 5k-symptom matrix (5-30 symptoms per disease, common symptoms
+shared by many diseases), against a plain Python loop over the profiles.
+
+    python -m benchmarks.bench_disease_index [--diseases 10000] [--symptoms 5000] [--queries 5000]
+"""
+import argparse
+import random
+import tempfile
+import time
+
+from symptom_mapping.disease_index import DiseaseIndex
+
+
+def make_profiles(rng, disease_count, symptom_count):
+    symptoms = [f"symptom {i}" for i in range(symptom_count)]
+    # Skewed popularity, like fever or fatigue showing up in most profiles
+    popularity = [1 / (rank + 1) ** 0.8 for rank in range(symptom_count)]
+    profiles = {}
+    for i in range(disease_count):
+        chosen = set(rng.choices(symptoms, weights=popularity, k=rng.randint(5, 30)))
+        profiles[f"disease {i}"] = {
+            "urgency": rng.choice(["Low", "Moderate", "High"]),
+            "symptoms": {name: round(rng.uniform(0.2, 1.0), 2) for name in chosen},
+        }
+    return profiles, symptoms, popularity
+
+
+def naive_rank(profiles, query, top_k):
+    query = set(query)
+    scored = []
+    for disease, profile in profiles.items():
+        weights = profile["symptoms"]
+        norm = sum(w * w for w in weights.values()) ** 0.5
+        score = sum(weights.get(s, 0.0) for s in query) / norm / len(query) ** 0.5
+        scored.append((score, disease))
+    return sorted(scored, reverse=True)[:top_k]
+
+
+def timed(label, fn, queries):
+    start = time.perf_counter()
+    for query in queries:
+        fn(query)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22} {len(queries) / elapsed:>12,.0f} queries/s  {elapsed / len(queries) * 1e6:>10.1f} us/query")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--diseases", type=int, default=10000)
+    parser.add_argument("--symptoms", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    profiles, symptoms, popularity = make_profiles(rng, args.diseases, args.symptoms)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        start = time.perf_counter()
+        meta = DiseaseIndex.save(profiles, cache_dir)
+        print(f"built {len(meta['diseases']):,} x {len(meta['symptoms']):,} matrix "
+              f"in {time.perf_counter() - start:.2f}s")
+
+        index = DiseaseIndex(profiles_path=None, cache_dir=cache_dir)
+        start = time.perf_counter()
+        index.load()
+        print(f"memory-mapped in {(time.perf_counter() - start) * 1000:.1f} ms, "
+              f"{index.stats()['nonzeros']:,} non-zeros")
+
+        queries = [rng.choices(symptoms, weights=popularity, k=rng.randint(3, 8)) for _ in range(args.queries)]
+        timed("index.rank", index.rank, queries)
+        timed("python loop", lambda q: naive_rank(profiles, q, 5), queries[:max(1, args.queries // 100)])
+
+        agree = sum(
+            [c["disease"] for c in index.rank(q)][:1] == [d for _, d in naive_rank(profiles, q, 1)]
+            for q in queries[:50]
+        )
+        print(f"top-1 agreement with the loop on 50 queries: {agree}/50")
+
+
+if __name__ == "__main__":
+    main()
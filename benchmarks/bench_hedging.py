@@ -0,0 +1,70 @@
+"""
+Tail latency with and without hedged requests, using local fake providers.
+
+The primary tier answers in ~`--latency` seconds but a `--tail-rate` fraction
+of calls stall for `--tail-latency`; the hedge tier is a steady second
+provider. Runs the same calls through llm_gateway.routing.ModelRouter with
+hedging off and on and prints per-tier and end-to-end percentiles.
+
+    python -m benchmarks.bench_hedging [--calls 400] [--concurrency 20]
+"""
+import argparse
+import asyncio
+import time
+
+from llm_gateway.fake import FakeModel
+from llm_gateway.routing import ModelRouter
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+async def run(router, calls, concurrency):
+    limit = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with limit:
+            start = time.perf_counter()
+            await router.call("followup", f"prompt {i}", timeout=30)
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    return latencies
+
+
+def report(label, router, latencies):
+    print(f"{label}: p50 {percentile(latencies, 50) * 1000:.0f} ms, p95 {percentile(latencies, 95) * 1000:.0f} ms, "
+          f"p99 {percentile(latencies, 99) * 1000:.0f} ms, hedges sent {router.counters['hedges_sent']}, "
+          f"hedge wins {router.counters['hedge_wins']}")
+    for name, stats in router.stats()["tiers"].items():
+        print(f"    tier {name:<8} calls {stats['calls']:>4}  p50 {stats['p50_ms']} ms  p95 {stats['p95_ms']} ms  "
+              f"p99 {stats['p99_ms']} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--tail-rate", type=float, default=0.05)
+    parser.add_argument("--tail-latency", type=float, default=3.0)
+    parser.add_argument("--hedge-latency", type=float, default=0.4)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    tiers = {"default": {"provider": "fake"}, "backup": {"provider": "fake"}}
+    for hedged in (False, True):
+        router = ModelRouter(tiers, routes={}, hedges={"followup": "backup"} if hedged else {})
+        router.set_model(FakeModel("ok", latency=args.latency, jitter=args.latency / 3, tail_rate=args.tail_rate,
+                                   tail_latency=args.tail_latency, seed=args.seed), tier="default")
+        router.set_model(FakeModel("ok", latency=args.hedge_latency, jitter=args.hedge_latency / 4,
+                                   seed=args.seed + 1), tier="backup")
+        latencies = asyncio.run(run(router, args.calls, args.concurrency))
+        report("hedged" if hedged else "unhedged", router, latencies)
+
+
+if __name__ == "__main__":
+    main()
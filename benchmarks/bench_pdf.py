@@ -0,0 +1,97 @@
+"""
+Microbenchmark for report PDF rendering: reports per second and bytes per
+report for helper_functions.helper.render_pdf, next to the previous layout
+(a fresh FPDF per report, one multi_cell per line, uncompressed streams).
+
+    python -m benchmarks.bench_pdf [--reports 200] [--repeat 3]
+"""
+import argparse
+import logging
+import time
+
+from fpdf import FPDF
+
+from helper_functions.helper import IncrementalPDF, render_pdf
+
+
+REPORT = """Age: 35 Years
+Gender: Woman
+Recommendation:
+Consult a physician within 24 hours. If the fever rises above 103F, breathing
+becomes difficult or the headache becomes severe, seek emergency care.
+Urgency: Moderate
+
+Relevant findings:
+- Hours since the onset of symptoms: 48
+- Fever with headache and body ache, worse in the evening
+- No rash, no neck stiffness, eating and drinking normally
+
+Possible conditions:
+- Viral fever (Moderate match): rest, fluids and paracetamol for the fever.
+  Watch for fever above 103F lasting more than three days.
+- Influenza (Moderate match): rest and fluids; see a doctor if short of breath.
+- Dengue (Low match): watch for bleeding gums, severe abdominal pain, vomiting.
+
+Medications:
+- Paracetamol 500mg every 6 hours as needed, no more than 4 doses a day
+
+Disclaimer:
+This report is generated automatically from the answers given and is not a
+diagnosis. Please consult a qualified doctor.
+"""
+
+
+def line_by_line(report):
+    pdf = FPDF()
+    pdf.set_compression(False)
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.add_page()
+    pdf.set_font("helvetica", "B", size=16)
+    pdf.cell(200, 10, "Medical Consultation Report", new_x="LMARGIN", new_y="NEXT", align="C")
+    pdf.ln(10)
+    pdf.set_font("helvetica", size=12)
+    for line in report.split("\n"):
+        pdf.multi_cell(0, 10, line, new_x="LMARGIN", new_y="NEXT")
+    pdf.set_y(-15)
+    pdf.set_font("helvetica", "I", 8)
+    pdf.cell(0, 10, f"Page {pdf.page_no()}", align="C")
+    return bytes(pdf.output())
+
+
+def streamed(report, chunk_size=40):
+    pdf = IncrementalPDF()
+    for i in range(0, len(report), chunk_size):
+        pdf.add_text(report[i:i + chunk_size])
+    return pdf.finish()
+
+
+def measure(label, render, report, count, repeat):
+    render(report)  # first call pays for imports and font setup
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(count):
+            pdf_bytes = render(report)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<16} {count / best:>10,.1f} reports/s  {best / count * 1000:>8.2f} ms/report  "
+          f"{len(pdf_bytes):>8,} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reports", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--pages", type=int, default=1, help="repeat the sample report to span more pages")
+    args = parser.parse_args()
+    # render_pdf logs a span per report
+    logging.getLogger("medical_diagnosis").setLevel(logging.WARNING)
+
+    report = "\n".join([REPORT] * args.pages)
+    measure("line by line", line_by_line, report, args.reports, args.repeat)
+    measure("render_pdf", render_pdf, report, args.reports, args.repeat)
+    measure("streamed", streamed, report, args.reports, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
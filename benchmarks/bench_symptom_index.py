@@ -0,0 +1,81 @@
+"""
+Benchmark for symptom_processing.normalization.SymptomIndex on a synthetic
+100k-term vocabulary (25k canonical symptoms with 3 synonyms each).
+
+    python -m benchmarks.bench_symptom_index [--canonical 25000] [--queries 20000]
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from symptom_processing.normalization import SymptomIndex
+
+
+SYLLABLES = [c + v for c in "bcdfghjklmnprstvwz" for v in "aeiou"]
+BODY_WORDS = ["pain", "ache", "swelling", "itch", "burning", "stiffness", "weakness", "cramp"]
+
+
+def make_word(rng, syllables=3):
+    return "".join(rng.choice(SYLLABLES) for _ in range(syllables))
+
+
+def make_vocabulary(rng, canonical_count):
+    vocabulary = {}
+    while len(vocabulary) < canonical_count:
+        canonical = f"{make_word(rng)} {rng.choice(BODY_WORDS)}"
+        vocabulary[canonical] = [
+            f"{rng.choice(BODY_WORDS)} in {canonical.split()[0]}",
+            canonical.replace(" ", ""),
+            f"{make_word(rng, 2)} {canonical}",
+        ]
+    return vocabulary
+
+
+def typo(rng, text):
+    i = rng.randrange(len(text) - 1)
+    return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+
+
+def timed(label, fn, queries):
+    start = time.perf_counter()
+    for query in queries:
+        fn(query)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22} {len(queries) / elapsed:>12,.0f} lookups/s  {elapsed / len(queries) * 1e6:>8.2f} us/lookup")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--canonical", type=int, default=26000)
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(rng, args.canonical)
+    names = [name for canonical, variants in vocabulary.items() for name in [canonical, *variants]]
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = SymptomIndex(vocabulary)
+    build_seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"indexed {len(index):,} terms in {build_seconds:.2f}s, peak memory {peak / 2**20:.1f} MB")
+
+    exact = [rng.choice(names) for _ in range(args.queries)]
+    fuzzy = [typo(rng, rng.choice(names)) for _ in range(args.queries)]
+    misses = [make_word(rng, 4) for _ in range(args.queries)]
+
+    timed("exact/synonym", index.lookup, exact)
+    timed("fuzzy (cold)", index.lookup, fuzzy)
+    timed("fuzzy (cached)", index.lookup, fuzzy)
+    timed("unknown terms", index.lookup, misses)
+
+    resolved = sum(index.lookup(query) is not None for query in fuzzy)
+    print(f"fuzzy resolution rate  {resolved / len(fuzzy):.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Runs the same scenario against every session store backend: two store
+instances stand in for two uvicorn workers, and a session written through one
+must be readable, updatable and deletable through the other, and fields
+written with `update` must survive the other saving an older copy. The Redis
+store uses fakeredis unless --redis-url points at a real server.
+
+    python -m benchmarks.check_session_store [--redis-url redis://localhost:6379/15]
+
+Needs fakeredis (or a Redis server) for the Redis backend.
+"""
+import argparse
+import asyncio
+import time
+
+from session_backend.store import InMemorySessionStore, RedisSessionStore
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+async def scenario(name, worker_a, worker_b, shared):
+    session = {"name": "Test", "age": 30, "gender": "Female", "symptoms": ["fever"], "chat_history": []}
+    await worker_a.save("s1", session)
+
+    loaded = await worker_b.get("s1")
+    if shared:
+        check(loaded == session, f"{name}: session saved on one worker is not visible on the other")
+        # e.g. the websocket's copy, loaded before any report existed
+        stale = await worker_a.get("s1")
+        # Callers must save after mutating; other backends hand out copies
+        loaded["chat_history"].append({"user": "Yes"})
+        await worker_b.save("s1", loaded)
+        again = await worker_a.get("s1")
+        check(again["chat_history"] == [{"user": "Yes"}], f"{name}: update from the other worker was lost")
+        await worker_b.update("s1", {"report": "Urgency: Low", "mapped_diseases": {"value": "flu"}})
+        check((await worker_a.get("s1"))["report"] == "Urgency: Low",
+              f"{name}: report text was not stored with the session")
+        # A late save of the older copy must not undo the fields written with update
+        stale["status"] = "ready_for_diagnosis"
+        await worker_a.save("s1", stale)
+        again = await worker_b.get("s1")
+        check(again["report"] == "Urgency: Low", f"{name}: a stale full save overwrote the report")
+        check(again["mapped_diseases"] == {"value": "flu"}, f"{name}: a stale full save dropped the mapping")
+        check(again["status"] == "ready_for_diagnosis", f"{name}: the full save itself was lost")
+        await worker_b.delete("s1")
+        check(await worker_a.get("s1") is None, f"{name}: delete on one worker did not reach the other")
+        await worker_b.update("s1", {"report": "late"})
+        check(await worker_a.get("s1") is None, f"{name}: update brought a deleted session back")
+    else:
+        check(loaded is None, f"{name}: process-local store unexpectedly shared a session")
+        check(await worker_a.get("s1") == session, f"{name}: session not readable on the worker that saved it")
+
+    check(await worker_a.get("missing") is None, f"{name}: unknown session should be None")
+    check(await worker_a.ping(), f"{name}: ping failed")
+    print(f"{name:<8} ok")
+
+
+async def check_ttl():
+    store = InMemorySessionStore(ttl_seconds=0.05)
+    await store.save("s", {"age": 1})
+    await asyncio.sleep(0.1)
+    check(await store.get("s") is None, "memory: expired session still returned")
+    store = InMemorySessionStore(max_entries=2)
+    for i in range(3):
+        await store.save(f"s{i}", {"i": i})
+    check(await store.get("s0") is None and store.stats()["evicted"] == 1, "memory: LRU cap not enforced")
+    print("ttl/lru  ok")
+
+
+def redis_clients(url):
+    if url:
+        import redis.asyncio as redis
+
+        return redis.from_url(url), redis.from_url(url)
+    import fakeredis
+
+    server = fakeredis.FakeServer()
+    return fakeredis.FakeAsyncRedis(server=server), fakeredis.FakeAsyncRedis(server=server)
+
+
+async def run(args):
+    start = time.perf_counter()
+    await scenario("memory", InMemorySessionStore(), InMemorySessionStore(), shared=False)
+    await check_ttl()
+    client_a, client_b = redis_clients(args.redis_url)
+    await scenario("redis", RedisSessionStore(client_a, prefix="check:"), RedisSessionStore(client_b, prefix="check:"),
+                   shared=True)
+    print(f"all checks passed in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--redis-url", help="use a real Redis server instead of fakeredis")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
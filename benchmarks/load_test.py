@@ -0,0 +1,362 @@
+"""
+Offline load test for the FastAPI app with Gemini replaced by a local fake.
+
+Starts main.app under uvicorn in a separate process, with
+llm_gateway.fake.FakeModel installed at the requested latency/jitter/error
+rate, then drives N concurrent synthetic patients through POST /symptom, the
+/followup websocket Q&A and /generate_report from this process. Keeping the
+client out of the server's process and event loop means the latencies and the
+memory figures are the server's own. Reports p50/p95/p99 per stage, requests
+per second, and the peak RSS of the server and of its NER worker processes,
+sampled from /proc (Linux) while they run.
+
+    python -m benchmarks.load_test [--patients 200] [--concurrency 50] \\
+        [--latency 0.8] [--jitter 0.3] [--error-rate 0.02] [--json baseline.json]
+
+Needs httpx and websockets (the latter ships with uvicorn[standard]).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+# Every prompt should reach the fake model, and sessions stay in-process
+os.environ.setdefault("LLM_CACHE_DISABLED", "1")
+os.environ.setdefault("SESSION_BACKEND", "memory")
+# The fake has no quota; a Gemini-sized rate limit would measure the limiter, not the app
+os.environ.setdefault("LLM_RATE_LIMIT_RPM", "0")
+
+import httpx
+import uvicorn
+import websockets
+
+from llm_gateway.fake import FakeModel
+from llm_gateway.gateway import set_model
+
+
+COMPLAINTS = [
+    "I have had a high fever and a headache since yesterday",
+    "Dry cough and sore throat for three days, feeling tired",
+    "Sharp stomach pain with nausea and vomiting since this morning",
+    "Dizziness and blurred vision when I stand up",
+    "Back pain that spreads down my left leg",
+    "Burning urination and frequent urination with mild fever",
+    "Itchy rash on both arms and a runny nose",
+    "Chest tightness and shortness of breath when climbing stairs",
+]
+SYMPTOMS = ["fever", "headache", "cough", "sore throat", "fatigue", "nausea", "vomiting",
+            "abdominal pain", "dizziness", "back pain", "rash", "chest pain"]
+
+MAPPING_TEXT = """1. Viral fever - fever with body ache and recent onset. Urgency: Moderate
+2. Influenza - fever, cough and fatigue together. Urgency: Moderate
+3. Dengue - high fever with headache and rash. Urgency: High"""
+
+REPORT_PAYLOAD = json.dumps({
+    "reason": "Fever with headache for two days", "findings": ["Fever for 48 hours", "Body ache"],
+    "conditions": [
+        {"name": "Viral fever", "match": "Moderate", "pre_hospital_care": ["Paracetamol for fever"],
+         "watch_for": ["Fever above 103F"], "self_care": ["Rest", "Drink fluids"]},
+        {"name": "Dengue", "match": "Low", "watch_for": ["Bleeding gums", "Severe abdominal pain"]},
+    ],
+    "medications": ["Paracetamol 500mg every 6 hours"], "urgency": "Moderate",
+    "recommendation": "Consult a physician within 24 hours.",
+})
+
+REPORT_TEXT = """Age: 35 Years
+Gender: Woman
+Recommendation:
+Consult a physician soon. If symptoms worsen, seek emergency care.
+Urgency: Moderate
+
+Relevant findings:
+- Hours since the onset of symptoms: 48
+- Fever with headache and body ache
+
+Possible conditions:
+- Viral fever
+- Influenza
+- Dengue
+""" * 3
+
+
+def make_responder(rng, ready_probability):
+    """Answers each pipeline prompt with a plausible, well-formed completion."""
+
+    def respond(prompt):
+        if "Extract only medical symptoms" in prompt:
+            return json.dumps({"symptoms": rng.sample(SYMPTOMS, 3)})
+        if "top medical diagnosis expert" in prompt:
+            if rng.random() < ready_probability:
+                return json.dumps({"ready_for_diagnosis": True})
+            return json.dumps({
+                "Question": f"How long have you had this symptom? ({rng.randrange(10**6)})",
+                "A": "Less than a day", "B": "1-3 days", "C": "4-7 days", "D": "More than a week",
+            })
+        if "most likely medical conditions" in prompt:
+            return MAPPING_TEXT
+        if "content of a patient report" in prompt:
+            return REPORT_PAYLOAD
+        return REPORT_TEXT
+
+    return respond
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LoadTest:
+    def __init__(self, base_url, rng):
+        self.base_url = base_url
+        self.ws_url = base_url.replace("http://", "ws://")
+        self.rng = rng
+        self.timings = defaultdict(list)
+        self.requests = 0
+        self.failures = defaultdict(int)
+
+    def _record(self, stage, start):
+        self.timings[stage].append(time.perf_counter() - start)
+        self.requests += 1
+
+    async def patient(self, client, number):
+        began = start = time.perf_counter()
+        response = await client.post("/symptom", json={
+            "name": f"Patient {number}", "age": self.rng.randint(5, 85),
+            "gender": self.rng.choice(["Male", "Female"]), "symptoms": self.rng.choice(COMPLAINTS),
+        })
+        if response.status_code != 200:
+            self.failures["symptom"] += 1
+            return
+        self._record("symptom", start)
+        session_id = response.json()["session_id"]
+
+        start = time.perf_counter()
+        async with websockets.connect(f"{self.ws_url}/followup/{session_id}") as ws:
+            turn = time.perf_counter()
+            while True:
+                message = json.loads(await ws.recv())
+                self._record("followup_turn", turn)
+                if "error" in message:
+                    self.failures["followup"] += 1
+                    return
+                if message.get("status") == "ready_for_diagnosis":
+                    break
+                turn = time.perf_counter()
+                await ws.send(self.rng.choice(message["options"])["key"])
+        self.timings["followup_total"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        response = await client.get(f"/generate_report/{session_id}")
+        if response.status_code != 200 or not response.content.startswith(b"%PDF"):
+            self.failures["report"] += 1
+            return
+        self._record("report", start)
+        self.timings["patient_total"].append(time.perf_counter() - began)
+
+    async def run(self, patients, concurrency):
+        limit = asyncio.Semaphore(concurrency)
+
+        async def one(client, number):
+            async with limit:
+                try:
+                    await self.patient(client, number)
+                except Exception as e:
+                    self.failures[type(e).__name__] += 1
+
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=120) as client:
+            await asyncio.gather(*(one(client, n) for n in range(patients)))
+
+
+def serve(args):
+    """Server side of the test, run in its own process by serve_and_run."""
+    rng = random.Random(args.seed)
+    set_model(FakeModel(make_responder(rng, args.ready_probability), latency=args.latency,
+                        jitter=args.jitter, error_rate=args.error_rate, seed=args.seed))
+
+    from main import app
+
+    uvicorn.run(app, host="127.0.0.1", port=args.serve, log_level="warning")
+
+
+def rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024  # reported in kB
+    except OSError:
+        pass  # exited meanwhile
+    return 0.0
+
+
+def descendants(pid):
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # The command name may contain spaces; the parent pid follows its closing paren
+                    parents[int(entry)] = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+    found, frontier = [], [pid]
+    while frontier:
+        children = [child for child, parent in parents.items() if parent in frontier]
+        found += children
+        frontier = children
+    return found
+
+
+class RSSSampler:
+    """Peak RSS of a process and, summed, of all its descendants (the NER workers), sampled periodically."""
+
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.server_peak_mb = 0.0
+        self.workers_peak_mb = 0.0
+        self.workers_seen = set()
+
+    def sample(self):
+        self.server_peak_mb = max(self.server_peak_mb, rss_mb(self.pid))
+        workers = descendants(self.pid)
+        self.workers_seen.update(workers)
+        self.workers_peak_mb = max(self.workers_peak_mb, sum(rss_mb(pid) for pid in workers))
+
+    async def run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+
+async def wait_until_up(base_url, process, timeout=120):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"server exited with code {process.returncode}")
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError("server did not come up in time")
+
+
+async def llm_call_count(base_url):
+    """Calls that reached the fake model, read from the server's /metrics."""
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        text = (await client.get("/metrics")).text
+    return sum(
+        int(float(line.rsplit(" ", 1)[1])) for line in text.splitlines()
+        if line.startswith("llm_calls_total{") and 'outcome="cache_hit"' not in line
+    )
+
+
+async def serve_and_run(args):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    command = [sys.executable, "-m", "benchmarks.load_test", "--serve", str(port),
+               "--latency", str(args.latency), "--jitter", str(args.jitter), "--error-rate", str(args.error_rate),
+               "--ready-probability", str(args.ready_probability), "--seed", str(args.seed)]
+    # The app's own prints would drown the results; warnings and errors still reach stderr
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    sampler = RSSSampler(process.pid)
+    sampling = None
+    try:
+        await wait_until_up(base_url, process)
+        sampling = asyncio.create_task(sampler.run())
+        test = LoadTest(base_url, random.Random(args.seed))
+        start = time.perf_counter()
+        await test.run(args.patients, args.concurrency)
+        wall = time.perf_counter() - start
+        sampler.sample()
+        llm_calls = await llm_call_count(base_url)
+    finally:
+        if sampling is not None:
+            sampling.cancel()
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return test, llm_calls, sampler, wall
+
+
+def summarize(test, llm_calls, sampler, wall, args):
+    stages = {}
+    for stage, values in test.timings.items():
+        stages[stage] = {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50) * 1000, 1),
+            "p95_ms": round(percentile(values, 95) * 1000, 1),
+            "p99_ms": round(percentile(values, 99) * 1000, 1),
+        }
+    return {
+        "config": {k: v for k, v in vars(args).items() if k != "serve"},
+        "wall_seconds": round(wall, 2),
+        "requests": test.requests,
+        "requests_per_second": round(test.requests / wall, 2) if wall else 0.0,
+        "patients_per_second": round(len(test.timings["report"]) / wall, 2) if wall else 0.0,
+        "llm_calls": llm_calls,
+        "failures": dict(test.failures),
+        "server_peak_rss_mb": round(sampler.server_peak_mb, 1),
+        "workers_peak_rss_mb": round(sampler.workers_peak_mb, 1),
+        "workers": len(sampler.workers_seen),
+        "stages": stages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--patients", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.8, help="fake Gemini latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--ready-probability", type=float, default=0.3,
+                        help="chance that an LLM follow-up turn declares the patient ready")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)  # internal: run the server on this port
+    args = parser.parse_args()
+    if args.serve:
+        serve(args)
+        return
+
+    test, llm_calls, sampler, wall = asyncio.run(serve_and_run(args))
+    results = summarize(test, llm_calls, sampler, wall, args)
+
+    print(f"{args.patients} patients, concurrency {args.concurrency}, {wall:.1f}s wall")
+    print(f"{results['requests_per_second']} req/s, {results['patients_per_second']} patients/s, "
+          f"{results['llm_calls']} LLM calls, failures: {results['failures'] or 'none'}")
+    print(f"peak RSS: server {results['server_peak_rss_mb']} MB, "
+          f"{results['workers']} NER workers {results['workers_peak_rss_mb']} MB together")
+    print(f"{'stage':<16} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for stage, row in results["stages"].items():
+        print(f"{stage:<16} {row['count']:>6} {row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,111 @@
-import os
-from dotenv import load_dotenv
-load_dotenv()
-import google.generativeai as genai
+import re
+from string import Template
+from typing import List, Literal
 
-#temprorary model for testing
-google_api_key = os.getenv("GOOGLE_API_KEY")
-genai.configure(api_key=google_api_key)
-model = genai.GenerativeModel("gemini-2.0-flash")
+from pydantic import BaseModel, Field
 
+from Followup_Generation.context import ConversationContext
+from helper_functions.metrics import span, timed
+from llm_gateway.gateway import generate_content_async, stream_content_async
+from llm_gateway.structured import generate_structured_async, stream_structured_async, StructuredOutputError
+
+
+# No defaults for the clinical judgements: a reply missing them goes to the
+# repair call or the free-text fallback rather than getting a made-up level
+class ConditionAdvice(BaseModel):
+    name: str = Field(..., min_length=1)
+    match: Literal["High", "Moderate", "Low", "Very low"]
+    pre_hospital_care: List[str] = []
+    watch_for: List[str] = []
+    self_care: List[str] = []
+
+
+class ReportPayload(BaseModel):
+    urgency: Literal["Low", "Moderate", "High", "Emergency"]
+    recommendation: str = Field(..., min_length=1)
+    reason: str = ""
+    findings: List[str] = []
+    conditions: List[ConditionAdvice] = []
+    medications: List[str] = []
+
+
+DISCLAIMER = (
+    "Disclaimer: This report was generated automatically from your answers for general guidance only.\n"
+    "It is not a medical diagnosis. Please consult a qualified doctor before taking any medication.\n"
+    "If symptoms are severe or worsening, seek emergency care immediately."
+)
+
+# Everything the model doesn't need to write: headings, patient header, layout and
+# disclaimer. The header only needs patient data, so it can be sent before the LLM answers.
+REPORT_HEADER = Template("""Age: $age Years
+Gender: $gender
+Symptoms reported: $symptoms
+
+""")
+# Patient header lines the free-text prompt makes the model write; ours replaces them
+_MODEL_HEADER_LINE = re.compile(r"\W*(age|gender|symptoms?(\s+reported)?)\W*:", re.IGNORECASE)
+
+
+def _bullets(items, indent=""):
+    return "\n".join(f"{indent}- {item}" for item in items) or f"{indent}- None noted"
+
+
+def _condition_advice(condition):
+    lines = [f"{condition.name} ({condition.match} match)"]
+    for title, items in (("Pre-hospital care", condition.pre_hospital_care),
+                         ("Symptoms to watch out for", condition.watch_for),
+                         ("Self-care", condition.self_care)):
+        if items:
+            lines.append(f"- {title}:")
+            lines.append(_bullets(items, indent="  "))
+    return "\n".join(lines)
+
+
+def render_report_header(age, gender, symptoms):
+    return REPORT_HEADER.substitute(age=age, gender=gender, symptoms=", ".join(symptoms) or "None")
+
+
+def _advice_section(values):
+    return "\n\n".join(_condition_advice(c) for c in values["conditions"]) or "- None noted"
+
+
+# Body sections in report order: the payload fields each one needs and how it is laid out
+REPORT_SECTIONS = (
+    (("recommendation", "urgency"),
+     lambda v: f"Recommendation:\n{v['recommendation']}\nUrgency: {v['urgency']}"),
+    (("reason",), lambda v: f"Reason for consultation:\n{v['reason'] or 'Not stated'}"),
+    (("findings",), lambda v: f"Relevant findings:\n{_bullets(v['findings'])}"),
+    (("conditions",),
+     lambda v: "Diseases (Match Levels):\n" + _bullets(f"{c.name}: {c.match} match" for c in v["conditions"])),
+    (("conditions",), lambda v: f"Relevant diseases advice:\n{_advice_section(v)}"),
+    (("medications",), lambda v: f"Medication Suggestions:\n{_bullets(v['medications'])}"),
+)
+
+
+def render_report_body(payload):
+    values = {name: getattr(payload, name) for fields, _ in REPORT_SECTIONS for name in fields}
+    return "".join(render(values) + "\n\n" for _, render in REPORT_SECTIONS) + DISCLAIMER + "\n"
+
+
+def render_report(payload, age, gender, symptoms):
+    """Lays out the full report text from the model's JSON payload."""
+    return render_report_header(age, gender, symptoms) + render_report_body(payload)
+
+
+def generate_structured_report_prompt(age, gender, symptoms, chat_history, mapped_diseases):
+    return f"""You are a senior medical assistant writing the content of a patient report.
+Patient: {age} years, {gender}. Symptoms: {", ".join(symptoms)}.
+Consultation:
+{ConversationContext(chat_history).render()}
+Likely conditions:
+{mapped_diseases}
+
+Reply with ONLY this JSON (no headings, no prose outside it):
+{{"recommendation": "one line", "urgency": "Low|Moderate|High|Emergency", "reason": "one line", "findings": ["..."],
+ "conditions": [{{"name": "...", "match": "High|Moderate|Low|Very low", "pre_hospital_care": ["..."], "watch_for": ["..."], "self_care": ["..."]}}],
+ "medications": ["OTC name (dose, use)"]}}
+Up to 3 conditions, 2-4 items per list, each item under 10 words. Plain language for patients in India.
+"""
 
 
 def generate_report_prompt(age, gender, symptoms, chat_history, mapped_diseases):
@@ -94,8 +192,87 @@ Keep language medically sound but easy to understand in india. End with a clear
 Donot expose Your privacy.I have to convert it to pdf.Make sure Your each line should be short and crisp.COC I HAVE TO CONVERT TO PDF/
 """
 
-def final_report(age, gender, symptoms, chat_history, mapped_diseases):
-    res=model.generate_content(generate_report_prompt(age, gender, symptoms, chat_history, mapped_diseases))
-    return res.text
+async def final_report_payload(age, gender, symptoms, chat_history, mapped_diseases):
+    """Asks Gemini for the report content only, as a validated ReportPayload."""
+    prompt = generate_structured_report_prompt(age, gender, symptoms, chat_history, mapped_diseases)
+    return await generate_structured_async(prompt, ReportPayload, call_type="report")
+
+
+def _drop_model_header(text):
+    lines = text.lstrip().split("\n")
+    while lines and (not lines[0].strip() or _MODEL_HEADER_LINE.match(lines[0])):
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+async def free_text_report_body(age, gender, symptoms, chat_history, mapped_diseases):
+    """
+    Fallback when no valid payload comes back: the whole report as free text,
+    with the model's own patient header dropped so it can follow ours, and the
+    disclaimer appended.
+    """
+    text = await generate_content_async(
+        generate_report_prompt(age, gender, symptoms, chat_history, mapped_diseases), call_type="report"
+    )
+    return _drop_model_header(text).rstrip() + "\n\n" + DISCLAIMER + "\n"
+
+
+async def stream_free_text_report_body(age, gender, symptoms, chat_history, mapped_diseases):
+    """free_text_report_body, streamed: held back only until the model's own header lines are past."""
+    prompt = generate_report_prompt(age, gender, symptoms, chat_history, mapped_diseases)
+    head = ""
+    async for chunk in stream_content_async(prompt, call_type="report"):
+        if head is None:
+            yield chunk
+            continue
+        head += chunk
+        *lines, _ = head.split("\n")
+        if any(line.strip() and not _MODEL_HEADER_LINE.match(line) for line in lines):
+            yield _drop_model_header(head)
+            head = None
+    if head is not None:
+        yield _drop_model_header(head)
+    yield "\n\n" + DISCLAIMER + "\n"
+
+
+@timed("final_report")
+async def final_report(age, gender, symptoms, chat_history, mapped_diseases):
+    """
+    Returns the report text. Gemini only writes the compact JSON payload; the
+    layout is rendered locally. If no valid payload comes back, it falls back
+    to asking for the whole free-text report.
+    """
+    try:
+        payload = await final_report_payload(age, gender, symptoms, chat_history, mapped_diseases)
+    except StructuredOutputError as e:
+        print(f"Structured report failed, falling back to free text: {e}")
+        body = await free_text_report_body(age, gender, symptoms, chat_history, mapped_diseases)
+        return render_report_header(age, gender, symptoms) + body
+    return render_report(payload, age, gender, symptoms)
 
 
+async def stream_final_report(age, gender, symptoms, chat_history, mapped_diseases):
+    """
+    Yields the report in pieces as it is generated: the locally rendered header
+    straight away, then each body section as soon as the streamed JSON payload
+    has closed the fields it needs. If the payload can't be validated or
+    repaired, the free-text report is streamed instead, after whatever
+    sections were already sent.
+    """
+    with span("final_report", streamed=True):
+        yield render_report_header(age, gender, symptoms)
+        prompt = generate_structured_report_prompt(age, gender, symptoms, chat_history, mapped_diseases)
+        values = {}
+        sections = list(REPORT_SECTIONS)
+        try:
+            async for name, value in stream_structured_async(prompt, ReportPayload, call_type="report"):
+                values[name] = value
+                while sections and all(field in values for field in sections[0][0]):
+                    _, render = sections.pop(0)
+                    yield render(values) + "\n\n"
+        except StructuredOutputError as e:
+            print(f"Structured report failed, falling back to free text: {e}")
+            async for chunk in stream_free_text_report_body(age, gender, symptoms, chat_history, mapped_diseases):
+                yield chunk
+            return
+        yield DISCLAIMER + "\n"
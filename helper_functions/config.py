@@ -0,0 +1,12 @@
+import os
+
+from dotenv import load_dotenv
+
+
+# Single place where .env is read. Modules read their settings with os.getenv
+# at import time, so this must be imported before any of them (main.py and
+# llm_gateway.gateway import it first).
+load_dotenv()
+
+GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-2.0-flash")
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
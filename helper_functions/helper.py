@@ -1,44 +1,156 @@
+import functools
+
 from fpdf import FPDF
+from fpdf.fonts import CORE_FONTS_CHARWIDTHS
+
+from helper_functions.metrics import timed
+
+
+REPORT_TITLE = "Medical Consultation Report"
+BODY_FONT_SIZE = 12
+LINE_HEIGHT = 10
+
+# Glyph widths of the body font in 1/1000 of the font size, shipped with fpdf2
+_BODY_CHAR_WIDTHS = CORE_FONTS_CHARWIDTHS["helvetica"]
+
+# Core PDF fonts only cover Latin-1; map the punctuation LLMs like to use
+_LATIN1_FALLBACKS = str.maketrans({
+    "\u2018": "'", "\u2019": "'", "\u201c": '"', "\u201d": '"', "\u2013": "-", "\u2014": "-",
+    "\u2022": "-", "\u2026": "...", "\u2264": "<=", "\u2265": ">=",
+})
+
+
+def _latin1(text):
+    return text.translate(_LATIN1_FALLBACKS).encode("latin-1", "replace").decode("latin-1")
+
+
+@functools.lru_cache(maxsize=16384)
+def _text_units(text):
+    return sum(_BODY_CHAR_WIDTHS[c] for c in text)
+
+
+def _longest_fitting_prefix(text, max_units):
+    width = 0
+    for i, c in enumerate(text):
+        width += _BODY_CHAR_WIDTHS[c]
+        if width > max_units:
+            return max(1, i)
+    return len(text)
 
-def convert_to_pdf(report, output_pdf_path):
-    try:
-       
-        pdf = FPDF()
-        pdf.set_auto_page_break(auto=True, margin=15)
-        
- 
-        pdf.add_page()
 
-        pdf.set_title("Medical Consultation Report")
-        pdf.set_author("AI Assistant")
-        
-   
-        pdf.set_font("Arial", "B", size=16) 
-        pdf.cell(200, 10, txt="Medical Consultation Report", ln=True, align="C")
-        pdf.ln(10)  
-        
+def wrap_line(text, max_units):
+    """
+    Greedy word wrap of one line of body text into lines at most `max_units`
+    wide, breaking inside a word only when the word alone is too long.
+    """
+    space = _BODY_CHAR_WIDTHS[" "]
+    lines = []
+    line, width = None, 0
+    for word in text.split(" "):
+        units = _text_units(word)
+        if line is None:
+            line, width = word, units
+        elif width + space + units <= max_units:
+            line, width = f"{line} {word}", width + space + units
+        else:
+            lines.append(line)
+            line, width = word, units
+        while width > max_units:
+            cut = _longest_fitting_prefix(line, max_units)
+            lines.append(line[:cut])
+            line = line[cut:]
+            width = sum(_BODY_CHAR_WIDTHS[c] for c in line)
+    lines.append(line)
+    return lines
 
-        pdf.set_font("Arial", size=12)
 
+class ReportPDF(FPDF):
+    """
+    Page template for consultation reports: the title on the first page, a
+    running header on the following ones and "Page n of N" at the bottom of
+    every page. Uses the built-in Helvetica, whose metrics ship with fpdf2,
+    so no font file is parsed per report, and compresses the page streams.
+    """
 
-        lines = report.split('\n')
+    def __init__(self):
+        super().__init__()
+        self.set_compression(True)
+        self.set_auto_page_break(auto=True, margin=15)
+        self.set_title(REPORT_TITLE)
+        self.set_author("AI Assistant")
+        self.add_page()
+        self.set_font("helvetica", size=BODY_FONT_SIZE)
 
+    def header(self):
+        if self.page_no() == 1:
+            self.set_font("helvetica", "B", size=16)
+            self.cell(0, 10, REPORT_TITLE, align="C", new_x="LMARGIN", new_y="NEXT")
+            self.ln(10)
+        else:
+            self.set_font("helvetica", "I", size=8)
+            self.cell(0, 6, REPORT_TITLE, align="R", new_x="LMARGIN", new_y="NEXT")
+            self.ln(4)
+        self.set_font("helvetica", size=BODY_FONT_SIZE)
+
+    def footer(self):
+        self.set_y(-15)
+        self.set_font("helvetica", "I", size=8)
+        self.cell(0, 10, f"Page {self.page_no()} of {{nb}}", align="C")
+
+    def add_paragraph(self, lines):
+        """
+        Lays out consecutive non-blank lines. They are wrapped here with the
+        preloaded glyph widths and written as plain cells, which is several
+        times faster than multi_cell's character-by-character line breaking.
+        """
+        max_units = (self.epw - 2 * self.c_margin) * self.k * 1000 / BODY_FONT_SIZE
+        for line in lines:
+            for row in wrap_line(_latin1(line), max_units):
+                self.cell(0, LINE_HEIGHT, row, new_x="LMARGIN", new_y="NEXT")
+
+    def add_blank_line(self):
+        self.ln(LINE_HEIGHT)
+
+
+class IncrementalPDF:
+    """
+    Builds a report PDF from text that arrives in chunks: each paragraph is
+    laid out as soon as the blank line that ends it is received, so only the
+    last paragraph is left to do when the stream ends.
+    """
+
+    def __init__(self):
+        self.pdf = ReportPDF()
+        self._pending = ""
+        self._paragraph = []
+
+    def add_text(self, chunk):
+        self._pending += chunk
+        *lines, self._pending = self._pending.split('\n')
         for line in lines:
-            pdf.multi_cell(0, 10, line)
-        
-       
-        pdf.set_y(-15)
-        pdf.set_font("Arial", "I", 8)
-        pdf.cell(0, 10, f"Page {pdf.page_no()}", 0, 0, "C")
-
-        
-        pdf.output(output_pdf_path)
-        
-       
-        print(f"PDF generated successfully at {output_pdf_path}")
-        return True  
-
-    except Exception as e:
-       
-        print(f"Error generating PDF: {e}")
-        return False  
+            if line.strip():
+                self._paragraph.append(line)
+            else:
+                self._flush()
+                self.pdf.add_blank_line()
+
+    def _flush(self):
+        if self._paragraph:
+            self.pdf.add_paragraph(self._paragraph)
+            self._paragraph = []
+
+    def finish(self):
+        """Lays out the remaining text and returns the PDF as bytes."""
+        if self._pending:
+            self._paragraph.append(self._pending)
+            self._pending = ""
+        self._flush()
+        return bytes(self.pdf.output())
+
+
+@timed("convert_to_pdf")
+def render_pdf(report):
+    """Renders the report in memory and returns the PDF bytes."""
+    pdf = IncrementalPDF()
+    pdf.add_text(report)
+    return pdf.finish()
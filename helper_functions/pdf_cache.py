@@ -0,0 +1,86 @@
+import asyncio
+import contextvars
+import functools
+import hashlib
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from helper_functions.helper import render_pdf
+
+
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", "2"))
+PDF_CACHE_MAX_ENTRIES = int(os.getenv("PDF_CACHE_MAX_ENTRIES", "256"))
+
+_render_pool = ThreadPoolExecutor(max_workers=PDF_RENDER_WORKERS, thread_name_prefix="pdf-render")
+
+
+def report_hash(report):
+    return hashlib.sha256(report.encode("utf-8")).hexdigest()
+
+
+class PDFCache:
+    """
+    LRU of rendered PDFs keyed by (session_id, report hash), so re-downloading
+    the same report never re-renders it. Also remembers the latest report per
+    session for download links.
+    """
+
+    def __init__(self, max_entries=PDF_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._latest = {}
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, session_id, digest):
+        key = (session_id, digest)
+        pdf_bytes = self._entries.get(key)
+        if pdf_bytes is None:
+            self.counters["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.counters["hits"] += 1
+        return pdf_bytes
+
+    def put(self, session_id, digest, pdf_bytes):
+        key = (session_id, digest)
+        self._entries[key] = pdf_bytes
+        self._entries.move_to_end(key)
+        self._latest[session_id] = digest
+        while len(self._entries) > self.max_entries:
+            (old_session, old_digest), _ = self._entries.popitem(last=False)
+            if self._latest.get(old_session) == old_digest:
+                del self._latest[old_session]
+            self.counters["evictions"] += 1
+
+    def latest(self, session_id):
+        digest = self._latest.get(session_id)
+        if digest is None:
+            return None
+        return self._entries.get((session_id, digest))
+
+    def stats(self):
+        return {**self.counters, "entries": len(self._entries), "max_entries": self.max_entries}
+
+
+pdf_cache = PDFCache()
+
+
+async def run_on_render_pool(fn, *args):
+    """Runs the CPU-bound `fn(*args)` on the PDF thread pool instead of the event loop."""
+    # Carry the request/session IDs into the worker thread for the timing span
+    call = functools.partial(contextvars.copy_context().run, fn, *args)
+    return await asyncio.get_running_loop().run_in_executor(_render_pool, call)
+
+
+async def render_report_pdf(session_id, report):
+    """
+    Returns the PDF bytes for `report`, rendering it on the PDF thread pool
+    (never on the event loop) unless it is already cached for this session.
+    """
+    digest = report_hash(report)
+    pdf_bytes = pdf_cache.get(session_id, digest)
+    if pdf_bytes is None:
+        pdf_bytes = await run_on_render_pool(render_pdf, report)
+        pdf_cache.put(session_id, digest, pdf_bytes)
+    return pdf_bytes
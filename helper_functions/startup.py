@@ -0,0 +1,46 @@
+import sys
+import time
+from contextlib import contextmanager
+
+
+# Heavy dependencies that should only be imported on first use, not at app import
+HEAVY_MODULES = ("spacy", "scispacy", "google.generativeai", "redis")
+
+
+class StartupTimer:
+    """
+    Records how long each startup phase takes (module imports, startup hooks,
+    background warm-up) relative to when this module was first imported.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.ready_seconds = None
+
+    def mark(self, phase):
+        """Records `phase` as finishing now, in seconds since this module was imported."""
+        self.phases[phase] = round(time.perf_counter() - self.started, 3)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round(time.perf_counter() - start, 3)
+
+    def mark_ready(self):
+        if self.ready_seconds is None:
+            self.ready_seconds = round(time.perf_counter() - self.started, 3)
+
+    def report(self):
+        return {
+            "phases_seconds": dict(self.phases),
+            "ready_seconds": self.ready_seconds,
+            "uptime_seconds": round(time.perf_counter() - self.started, 3),
+            "heavy_modules_loaded": {name: name in sys.modules for name in HEAVY_MODULES},
+        }
+
+
+startup_timer = StartupTimer()
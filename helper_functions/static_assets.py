@@ -0,0 +1,135 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+
+STATIC_DIR = os.getenv("STATIC_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "html"))
+# Files smaller than this aren't worth compressing
+STATIC_MIN_COMPRESS_BYTES = int(os.getenv("STATIC_MIN_COMPRESS_BYTES", "256"))
+
+REVALIDATE = "no-cache"  # may be stored, but checked with If-None-Match every time
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+class Asset:
+    """One file with its precompressed variants and their strong ETags."""
+
+    def __init__(self, name, data):
+        self.name = name
+        self.media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if self.media_type.startswith("text/"):
+            self.media_type += "; charset=utf-8"
+        self.version = hashlib.sha256(data).hexdigest()[:16]
+        self.bodies = {"identity": data}
+        if len(data) >= STATIC_MIN_COMPRESS_BYTES:
+            self.bodies["gzip"] = gzip.compress(data, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.bodies["br"] = brotli.compress(data, quality=11)
+        # Each encoding is a different representation, so it gets its own strong ETag
+        self.etags = {encoding: f'"{self.version}-{encoding}"' for encoding in self.bodies}
+
+
+def _accepted_encodings(header):
+    accepted = set()
+    for part in (header or "").split(","):
+        coding, _, params = part.partition(";")
+        params = params.strip().replace(" ", "")
+        try:
+            quality = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            quality = 1.0
+        if quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _etag_matches(header, etag):
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, so a W/ prefix doesn't matter
+    return etag in {tag.strip().removeprefix("W/") for tag in header.split(",")}
+
+
+class StaticAssets:
+    """
+    Serves the files of `directory` (the html/ frontend) from memory. Every
+    file is read and compressed with gzip, and brotli when installed, once
+    at load, so requests only pick the smallest encoding the client accepts.
+
+    Responses carry a strong ETag and answer a matching If-None-Match with
+    304. Pages are sent with Cache-Control: no-cache so a deploy shows up on
+    the next load; a URL carrying the file's current version (`?v=`, see
+    `url`) is cached as immutable for a year instead.
+    """
+
+    def __init__(self, directory=STATIC_DIR):
+        self.directory = directory
+        self.assets = {}
+        self.loaded = False
+        self.counters = {"responses": 0, "not_modified": 0, "br": 0, "gzip": 0, "identity": 0}
+
+    def load(self):
+        assets = {}
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if os.path.isfile(path) and not name.startswith("."):
+                with open(path, "rb") as f:
+                    assets[name] = Asset(name, f.read())
+        self.assets = assets
+        self.loaded = True
+
+    def url(self, name):
+        """Versioned URL for `name`, safe to cache forever."""
+        return f"/static/{name}?v={self.assets[name].version}"
+
+    def respond(self, name, headers, version=None):
+        """
+        Returns (status, body, response headers) for asset `name` given the
+        request headers, or None when there is no such asset.
+        """
+        asset = self.assets.get(name)
+        if asset is None:
+            return None
+
+        accepted = _accepted_encodings(headers.get("accept-encoding"))
+        encoding = next(
+            (e for e in ("br", "gzip") if e in asset.bodies and (e in accepted or "*" in accepted)), "identity"
+        )
+        response_headers = {
+            "ETag": asset.etags[encoding],
+            "Cache-Control": IMMUTABLE if version == asset.version else REVALIDATE,
+            "Vary": "Accept-Encoding",
+        }
+        self.counters["responses"] += 1
+
+        if _etag_matches(headers.get("if-none-match"), asset.etags[encoding]):
+            self.counters["not_modified"] += 1
+            return 304, b"", response_headers
+
+        self.counters[encoding] += 1
+        if encoding != "identity":
+            response_headers["Content-Encoding"] = encoding
+        response_headers["Content-Type"] = asset.media_type
+        return 200, asset.bodies[encoding], response_headers
+
+    def stats(self):
+        return {
+            "loaded": self.loaded,
+            "brotli": brotli is not None,
+            **self.counters,
+            "assets": {
+                name: {"url": self.url(name), **{e: len(body) for e, body in asset.bodies.items()}}
+                for name, asset in self.assets.items()
+            },
+        }
+
+
+static_assets = StaticAssets()
@@ -0,0 +1,210 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import time
+
+from helper_functions.metrics import registry
+
+
+# Gemini quota this worker may use; 0 turns rate limiting off
+LLM_RATE_LIMIT_RPM = float(os.getenv("LLM_RATE_LIMIT_RPM", "600"))
+LLM_RATE_BURST = int(os.getenv("LLM_RATE_BURST", "20"))
+# Calls allowed to wait for a token before new ones are rejected with 429
+LLM_ADMISSION_MAX_QUEUE = int(os.getenv("LLM_ADMISSION_MAX_QUEUE", "200"))
+LLM_ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("LLM_ADMISSION_MAX_WAIT_SECONDS", "10"))
+
+# Lower numbers are served first
+PRIORITY_FOLLOWUP = 0  # a patient is waiting on an open websocket
+PRIORITY_REPORT = 1
+PRIORITY_INTAKE = 2  # new consultations can wait the longest...
+PRIORITY_SPECULATIVE = 3  # ...except prefetches nobody has asked for yet
+PRIORITY_BATCH = 4  # offline batch jobs only use capacity nobody else needs
+
+PRIORITY_NAMES = {PRIORITY_FOLLOWUP: "followup", PRIORITY_REPORT: "report",
+                  PRIORITY_INTAKE: "intake", PRIORITY_SPECULATIVE: "speculative", PRIORITY_BATCH: "batch"}
+
+# Set by the endpoints; every LLM call made in that context is admitted at this priority
+llm_priority = contextvars.ContextVar("llm_priority", default=PRIORITY_INTAKE)
+
+admission_wait_seconds = registry.histogram(
+    "llm_admission_wait_seconds", "Time LLM calls waited for a rate-limit token", labels=("priority",)
+)
+admission_rejected = registry.counter(
+    "llm_admission_rejected_total", "LLM calls rejected by admission control", labels=("priority", "reason")
+)
+
+
+class AdmissionRejected(Exception):
+    """Raised when the LLM queue is full or a call waited too long; maps to HTTP 429."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"LLM capacity exhausted ({reason}), retry after {retry_after:.0f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def seconds_until_token(self):
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class AdmissionController:
+    """
+    Gates every outgoing LLM call behind a token bucket sized to the Gemini
+    quota. Calls that find no token wait in a priority queue, so turns of
+    consultations already in progress go ahead of new intakes and speculative
+    prefetches. When the queue is full, or a call would wait longer than
+    `max_wait_seconds`, AdmissionRejected is raised straight away instead of
+    letting every request's latency collapse together; a full queue makes room
+    for a more urgent call by rejecting its least urgent waiter.
+    """
+
+    def __init__(self, rate_per_minute=LLM_RATE_LIMIT_RPM, burst=LLM_RATE_BURST,
+                 max_queue=LLM_ADMISSION_MAX_QUEUE, max_wait_seconds=LLM_ADMISSION_MAX_WAIT_SECONDS):
+        self.enabled = rate_per_minute > 0
+        self.rate = rate_per_minute / 60
+        self.bucket = TokenBucket(self.rate, burst) if self.enabled else None
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self._queue = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self._dispatcher = None
+        self._dispatcher_loop = None
+        self.counters = {"admitted": 0, "queued": 0, "admitted_from_queue": 0,
+                         "rejected_queue_full": 0, "rejected_timeout": 0, "rejected_evicted": 0}
+        self._total_wait = 0.0
+
+    def _waiting(self):
+        # Callers that gave up stay in the heap until the dispatcher pops them
+        return sum(1 for _, _, future in self._queue if not future.done())
+
+    def _retry_after(self):
+        # Roughly how long the current backlog needs to drain
+        return max(1.0, (self._waiting() + 1) / self.rate)
+
+    def _reject(self, reason, priority):
+        self.counters[f"rejected_{reason}"] += 1
+        admission_rejected.inc(priority=PRIORITY_NAMES.get(priority, priority), reason=reason)
+        raise AdmissionRejected(reason, self._retry_after())
+
+    async def acquire(self, priority=None):
+        """Waits for permission to make one LLM call, or raises AdmissionRejected."""
+        if not self.enabled:
+            return
+        if priority is None:
+            priority = llm_priority.get()
+        label = PRIORITY_NAMES.get(priority, priority)
+
+        if not self._queue and self.bucket.try_acquire():
+            self.counters["admitted"] += 1
+            admission_wait_seconds.observe(0.0, priority=label)
+            return
+        if self._waiting() >= self.max_queue and not self._evict_lower_than(priority):
+            self._reject("queue_full", priority)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), future))
+        self.counters["queued"] += 1
+        self._ensure_dispatcher(loop)
+
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.max_wait_seconds)
+        except asyncio.TimeoutError:
+            if not future.done():
+                future.cancel()  # the dispatcher skips cancelled entries
+                self._reject("timeout", priority)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        waited = time.perf_counter() - start
+        self._total_wait += waited
+        self.counters["admitted"] += 1
+        self.counters["admitted_from_queue"] += 1
+        admission_wait_seconds.observe(waited, priority=label)
+
+    def try_acquire(self):
+        """
+        Takes a token only if one is free right now and nobody is queued for
+        it, for optional calls such as hedged duplicates that should be
+        dropped rather than wait or jump ahead of a waiting call.
+        """
+        if not self.enabled:
+            return True
+        if self._waiting() or not self.bucket.try_acquire():
+            return False
+        self.counters["admitted"] += 1
+        return True
+
+    def _evict_lower_than(self, priority):
+        # A full queue still takes an urgent call by bumping the least urgent waiter
+        waiting = [entry for entry in self._queue if not entry[2].done()]
+        worst = max(waiting, key=lambda entry: (entry[0], entry[1]), default=None)
+        if worst is None or worst[0] <= priority:
+            return False
+        self.counters["rejected_evicted"] += 1
+        admission_rejected.inc(priority=PRIORITY_NAMES.get(worst[0], worst[0]), reason="evicted")
+        worst[2].set_exception(AdmissionRejected("evicted", self._retry_after()))
+        return True
+
+    def _ensure_dispatcher(self, loop):
+        if self._dispatcher is None or self._dispatcher.done() or self._dispatcher_loop is not loop:
+            self._dispatcher = loop.create_task(self._dispatch())
+            self._dispatcher_loop = loop
+
+    async def _dispatch(self):
+        while self._queue:
+            if not self.bucket.try_acquire():
+                await asyncio.sleep(self.bucket.seconds_until_token())
+                continue
+            # Hand the token to the most urgent caller still waiting
+            while self._queue:
+                _, _, future = heapq.heappop(self._queue)
+                if not future.done():
+                    future.set_result(None)
+                    break
+            else:
+                self.bucket.tokens += 1  # everyone left had given up; keep the token
+
+    def stats(self):
+        queued_waits = self.counters["admitted_from_queue"]
+        return {
+            "enabled": self.enabled,
+            "rate_per_minute": self.rate * 60,
+            "burst": self.bucket.burst if self.enabled else None,
+            "queue_depth": self._waiting(),
+            "max_queue": self.max_queue,
+            "queue_depth_by_priority": {
+                name: sum(1 for p, _, f in self._queue if p == priority and not f.done())
+                for priority, name in PRIORITY_NAMES.items()
+            },
+            "avg_queued_wait_seconds": round(self._total_wait / queued_waits, 4) if queued_waits else 0.0,
+            **self.counters,
+        }
+
+
+admission = AdmissionController()
@@ -0,0 +1,164 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048"))
+# Optional on-disk tier shared across restarts (and across workers on one host)
+LLM_CACHE_SQLITE_PATH = os.getenv("LLM_CACHE_SQLITE_PATH")
+LLM_CACHE_DISABLED = os.getenv("LLM_CACHE_DISABLED", "0") == "1"
+
+# Seconds a completion stays valid, per pipeline call type. Symptom extraction is a
+# pure function of the text so it can live much longer than conversational calls.
+CACHE_TTLS = {
+    "symptom_extraction": 24 * 3600,
+    "followup": 3600,
+    "mapping": 3600,
+    "report": 3600,
+    "default": 3600,
+}
+CACHE_TTLS.update(json.loads(os.getenv("LLM_CACHE_TTLS", "{}")))
+
+
+_whitespace = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt):
+    # Prompts are f-strings with incidental indentation; collapse it so cosmetic
+    # whitespace changes don't split the cache
+    return _whitespace.sub(" ", str(prompt)).strip()
+
+
+def make_cache_key(model_name, prompt, **params):
+    payload = json.dumps(
+        {"model": model_name, "prompt": normalize_prompt(prompt), "params": params},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Content-addressed completion cache: an in-memory LRU tier in front of an
+    optional SQLite tier. Entries expire after a per-call-type TTL. Memory hits
+    are answered inline; SQLite reads run in a worker thread and writes are
+    queued on a single writer thread.
+    """
+
+    def __init__(self, max_entries=LLM_CACHE_MAX_ENTRIES, sqlite_path=LLM_CACHE_SQLITE_PATH,
+                 ttls=CACHE_TTLS):
+        self.max_entries = max_entries
+        self.ttls = ttls
+        self._memory = OrderedDict()
+        # Guards the memory tier only, and is taken on the event loop: never held during SQLite I/O
+        self._lock = threading.Lock()
+        self._db = None
+        # Serializes use of the shared SQLite connection between the reader and writer threads
+        self._db_lock = threading.Lock()
+        # One thread owns SQLite writes (and their fsync) so they never run on the event loop
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-cache-writer")
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.commit()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "sets": 0, "evictions": 0, "expired": 0}
+
+    def ttl_for(self, call_type):
+        return self.ttls.get(call_type, self.ttls["default"])
+
+    async def get(self, key):
+        """Looks `key` up in memory, then on disk; the SQLite query runs in a thread."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+                self.counters["expired"] += 1
+
+        if self._db is not None:
+            value = await asyncio.to_thread(self._disk_get, key, now)
+            if value is not None:
+                return value
+
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    def _disk_get(self, key, now):
+        with self._db_lock:
+            row = self._db.execute("SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at > now:
+            with self._lock:
+                self._remember(key, value, expires_at)
+                self.counters["disk_hits"] += 1
+            return value
+        with self._lock:
+            self.counters["expired"] += 1
+        self._writer.submit(self._disk_write, "DELETE FROM llm_cache WHERE key = ?", (key,))
+        return None
+
+    def set(self, key, value, call_type="default"):
+        """Stores `value` in memory now; the SQLite write is queued on the cache's writer thread."""
+        expires_at = time.time() + self.ttl_for(call_type)
+        with self._lock:
+            self._remember(key, value, expires_at)
+            self.counters["sets"] += 1
+        if self._db is not None:
+            self._writer.submit(
+                self._disk_write,
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+
+    def _disk_write(self, statement, params):
+        try:
+            with self._db_lock:
+                self._db.execute(statement, params)
+                self._db.commit()
+        except sqlite3.Error as e:
+            print(f"LLM cache disk write failed: {e}")
+
+    def _remember(self, key, value, expires_at):
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self._db is not None:
+            self._writer.submit(self._disk_write, "DELETE FROM llm_cache", ())
+
+    def stats(self):
+        hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+        lookups = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "disk_tier": self._db is not None,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+llm_cache = LLMCache()
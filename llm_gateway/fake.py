@@ -0,0 +1,80 @@
+import asyncio
+import random
+
+
+class FakeAPIError(Exception):
+    """Mimics google.api_core errors closely enough for the gateway's retry logic."""
+
+    def __init__(self, code, message="fake API error"):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeStreamResponse:
+    """Async iterator over a completion split into fixed-size chunks."""
+
+    def __init__(self, text, chunk_size, chunk_delay):
+        self.text = text
+        self._chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        self._chunk_delay = chunk_delay
+
+    async def __aiter__(self):
+        for chunk in self._chunks:
+            await asyncio.sleep(self._chunk_delay)
+            yield FakeResponse(chunk)
+
+
+class FakeModel:
+    """
+    Local stand-in for genai.GenerativeModel. Install it with
+    llm_gateway.gateway.set_model(FakeModel(...)) to run the pipeline offline.
+
+    `responder` is either a fixed string or a callable taking the prompt and
+    returning the completion text. `latency`/`jitter` are in seconds and
+    `error_rate` is the fraction of calls that fail with `error_code`, and a
+    `tail_rate` fraction of calls take `tail_latency` seconds instead, to model
+    a slow tail.
+    Streaming calls (stream=True) return the text in `stream_chunk_size`
+    character chunks, `stream_chunk_delay` seconds apart.
+    """
+
+    def __init__(self, responder="Ready for diagnosis", latency=0.0, jitter=0.0, error_rate=0.0,
+                 error_code=503, stream_chunk_size=64, stream_chunk_delay=0.0, tail_rate=0.0, tail_latency=0.0,
+                 seed=None):
+        self.responder = responder
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.stream_chunk_size = stream_chunk_size
+        self.stream_chunk_delay = stream_chunk_delay
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.calls = 0
+        self.prompts = []
+        self._random = random.Random(seed)
+
+    def _delay(self):
+        if self.tail_rate and self._random.random() < self.tail_rate:
+            return self.tail_latency
+        return max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+
+    def _respond(self, prompt):
+        self.calls += 1
+        self.prompts.append(prompt)
+        if self._random.random() < self.error_rate:
+            raise FakeAPIError(self.error_code)
+        text = self.responder(prompt) if callable(self.responder) else self.responder
+        return FakeResponse(text)
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        await asyncio.sleep(self._delay())
+        response = self._respond(prompt)
+        if stream:
+            return FakeStreamResponse(response.text, self.stream_chunk_size, self.stream_chunk_delay)
+        return response
@@ -0,0 +1,232 @@
+import asyncio
+import os
+import random
+
+from helper_functions.config import GEMINI_MODEL_NAME
+from helper_functions.metrics import llm_calls, llm_tokens
+from llm_gateway.admission import admission
+from llm_gateway.cache import llm_cache, make_cache_key, LLM_CACHE_DISABLED
+from llm_gateway.routing import router
+
+MODEL_NAME = GEMINI_MODEL_NAME
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "8"))
+# How long one readiness probe waits for the model check; kept well under the probe's own timeout
+LLM_VALIDATE_TIMEOUT_SECONDS = float(os.getenv("LLM_VALIDATE_TIMEOUT_SECONDS", "3"))
+
+# Rate limiting and transient server errors are worth retrying; anything else is not
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+_model_status = {"validated": False, "error": None}
+_validation = None
+_validation_loop = None
+_semaphore = None
+_semaphore_loop = None
+
+
+def get_model(call_type="default"):
+    """Returns the model serving `call_type` (see llm_gateway.routing), the default tier if unrouted."""
+    return router.tier_for(call_type).model
+
+
+def _fetch_gemini_model(name):
+    import google.generativeai as genai
+
+    return genai.get_model(f"models/{name}")
+
+
+async def _check_model(tier):
+    model = await tier.load()
+    try:
+        await asyncio.to_thread(_fetch_gemini_model, tier.model_name)
+    except Exception as e:
+        error = repr(e)
+    else:
+        error = None
+    if tier.model is model:  # not replaced by set_model in the meantime
+        _model_status.update(validated=error is None, error=error)
+
+
+async def validate_model():
+    """
+    Checks once that the configured model exists and the API key works, for the
+    readiness probe rather than at import. The result is cached after success;
+    failures are retried on the next probe. Models installed with set_model are
+    taken as valid.
+
+    Concurrent probes share one in-flight check, and each waits at most
+    LLM_VALIDATE_TIMEOUT_SECONDS for it; a check still running is reported as
+    not validated yet and left to finish for a later probe.
+    """
+    global _validation, _validation_loop
+    if _model_status["validated"]:
+        return _model_status
+    tier = router.tier_for("default")
+    if not hasattr(await tier.load(), "model_name"):  # a fake or another provider, not a real Gemini model
+        _model_status.update(validated=True, error=None)
+        return _model_status
+    loop = asyncio.get_running_loop()
+    if _validation is None or _validation.done() or _validation_loop is not loop:
+        _validation = asyncio.ensure_future(_check_model(tier))
+        _validation_loop = loop
+    try:
+        await asyncio.wait_for(asyncio.shield(_validation), LLM_VALIDATE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        return {**_model_status, "error": "model validation still running"}
+    return _model_status
+
+
+def set_model(model, tier=None):
+    """
+    Replaces the model of one tier, or of every tier when `tier` is None, e.g.
+    with llm_gateway.fake.FakeModel in tests and benchmarks. Anything with an
+    async generate_content_async works.
+    """
+    global _validation
+    router.set_model(model, tier)
+    _model_status.update(validated=False, error=None)
+    _validation = None
+
+
+def _get_semaphore():
+    # asyncio primitives are bound to one event loop; recreate it if the loop changed
+    # (e.g. successive asyncio.run calls from scripts)
+    global _semaphore, _semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _semaphore is None or _semaphore_loop is not loop:
+        _semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        _semaphore_loop = loop
+    return _semaphore
+
+
+def _status_code(exc):
+    code = getattr(exc, "code", None)
+    if code is None:
+        code = getattr(exc, "status_code", None)
+    try:
+        return int(code)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(exc):
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    return _status_code(exc) in RETRYABLE_STATUS_CODES
+
+
+def _backoff_seconds(attempt):
+    # Full jitter: spreads retries out so workers don't hammer the API in lockstep
+    return random.uniform(0, min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+
+def _record_usage(response, call_type):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+    llm_tokens.inc(prompt_tokens, call_type=call_type, direction="input")
+    llm_tokens.inc(output_tokens, call_type=call_type, direction="output")
+
+
+def cache_key(prompt, call_type, kwargs):
+    # Keyed by the serving model, so re-routing a call type doesn't return another model's answers
+    return make_cache_key(router.tier_for(call_type).model_name, prompt, **kwargs)
+
+
+async def generate_content_async(prompt, call_type="default", bypass_cache=False, timeout=LLM_TIMEOUT_SECONDS,
+                                 max_retries=LLM_MAX_RETRIES, **kwargs):
+    """
+    Generates a completion for `prompt` without blocking the event loop and
+    returns its text.
+
+    Completions are cached by (model, normalized prompt, kwargs) with the TTL of
+    `call_type`; `bypass_cache` skips both the lookup and the write.
+    At most LLM_MAX_CONCURRENCY calls are in flight per process. Each attempt is
+    bounded by `timeout`; timeouts, 429s and 5xx errors are retried up to
+    `max_retries` times with jittered exponential backoff. Other errors, and the
+    last retryable one, are raised to the caller. Every attempt first goes
+    through admission control, which may raise AdmissionRejected.
+    """
+    use_cache = not (bypass_cache or LLM_CACHE_DISABLED)
+    if use_cache:
+        key = cache_key(prompt, call_type, kwargs)
+        cached = await llm_cache.get(key)
+        if cached is not None:
+            llm_calls.inc(call_type=call_type, outcome="cache_hit")
+            return cached
+
+    for attempt in range(max_retries + 1):
+        # Every attempt, retries included, spends rate-limit quota
+        await admission.acquire()
+        try:
+            async with _get_semaphore():
+                response = await router.call(call_type, prompt, timeout, **kwargs)
+            text = response.text
+            llm_calls.inc(call_type=call_type, outcome="ok")
+            _record_usage(response, call_type)
+            if use_cache:
+                llm_cache.set(key, text, call_type)
+            return text
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                llm_calls.inc(call_type=call_type, outcome="error")
+                raise
+            llm_calls.inc(call_type=call_type, outcome="retry")
+            delay = _backoff_seconds(attempt)
+            print(f"LLM call failed ({e!r}), retrying in {delay:.2f}s (attempt {attempt + 1}/{max_retries})")
+            await asyncio.sleep(delay)
+
+
+async def stream_content_async(prompt, call_type="default", bypass_cache=False, timeout=LLM_TIMEOUT_SECONDS,
+                               max_retries=LLM_MAX_RETRIES, **kwargs):
+    """
+    Async generator yielding the completion for `prompt` chunk by chunk as the
+    model produces it. `timeout` bounds the wait for each chunk. Failures are
+    retried like generate_content_async, but only before the first chunk has
+    been yielded. A cached completion is yielded as a single chunk.
+    """
+    use_cache = not (bypass_cache or LLM_CACHE_DISABLED)
+    if use_cache:
+        key = cache_key(prompt, call_type, kwargs)
+        cached = await llm_cache.get(key)
+        if cached is not None:
+            llm_calls.inc(call_type=call_type, outcome="cache_hit")
+            yield cached
+            return
+
+    model = await router.tier_for(call_type).load()
+    for attempt in range(max_retries + 1):
+        parts = []
+        # Every attempt, retries included, spends rate-limit quota
+        await admission.acquire()
+        try:
+            async with _get_semaphore():
+                response = await asyncio.wait_for(model.generate_content_async(prompt, stream=True, **kwargs), timeout)
+                chunks = response.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+                    except StopAsyncIteration:
+                        break
+                    parts.append(chunk.text)
+                    yield chunk.text
+            llm_calls.inc(call_type=call_type, outcome="ok")
+            _record_usage(response, call_type)
+            if use_cache:
+                llm_cache.set(key, "".join(parts), call_type)
+            return
+        except Exception as e:
+            if parts or attempt >= max_retries or not is_retryable(e):
+                llm_calls.inc(call_type=call_type, outcome="error")
+                raise
+            llm_calls.inc(call_type=call_type, outcome="retry")
+            delay = _backoff_seconds(attempt)
+            print(f"LLM stream failed ({e!r}), retrying in {delay:.2f}s (attempt {attempt + 1}/{max_retries})")
+            await asyncio.sleep(delay)
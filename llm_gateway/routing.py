@@ -0,0 +1,268 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+
+from helper_functions.config import GEMINI_MODEL_NAME, GOOGLE_API_KEY
+from helper_functions.metrics import registry
+from llm_gateway.admission import admission
+
+
+# Tier name -> provider settings, e.g.
+#   {"fast": {"provider": "gemini", "model": "gemini-2.0-flash-lite"},
+#    "default": {"provider": "gemini", "model": "gemini-2.0-flash"},
+#    "groq": {"provider": "groq", "model": "llama-3.1-8b-instant"}}
+# Providers: "gemini", "groq" and "fake" (llm_gateway.fake.FakeModel; any other
+# keys are passed to it, e.g. "latency", "jitter", "error_rate").
+LLM_TIERS = json.loads(os.getenv("LLM_TIERS", "{}"))
+# call_type -> tier, e.g. {"symptom_extraction": "fast"}; unlisted call types use "default"
+LLM_ROUTES = json.loads(os.getenv("LLM_ROUTES", "{}"))
+# call_type -> tier that gets a hedged duplicate, e.g. {"followup": "groq"}
+LLM_HEDGES = json.loads(os.getenv("LLM_HEDGES", "{}"))
+# Send the hedge once the primary tier's recent p95 latency has passed...
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+# ...using this delay until the tier has LLM_HEDGE_MIN_SAMPLES latencies recorded
+LLM_HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_SECONDS", "2"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LATENCY_WINDOW = 512
+
+DEFAULT_TIER = "default"
+
+tier_latency_seconds = registry.histogram(
+    "llm_tier_latency_seconds", "LLM latency per model tier", labels=("tier", "status")
+)
+hedged_requests = registry.counter(
+    "llm_hedged_requests_total", "Hedged duplicate LLM requests by outcome", labels=("call_type", "outcome")
+)
+
+
+class _Usage:
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+
+class _TextResponse:
+    """Gemini-shaped response (`.text`, `.usage_metadata`) for other providers."""
+
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+    async def __aiter__(self):
+        # Providers without streaming here hand back the whole text as one chunk
+        yield self
+
+
+class GroqModel:
+    """Adapts the Groq chat completions API to the generate_content_async interface the gateway uses."""
+
+    def __init__(self, name, api_key=None):
+        from groq import AsyncGroq
+
+        api_key = api_key or os.getenv("GROQ_API_KEY")
+        self.name = name
+        self._async_client = AsyncGroq(api_key=api_key)
+
+    def _params(self, prompt, generation_config):
+        params = {"model": self.name, "messages": [{"role": "user", "content": prompt}]}
+        if (generation_config or {}).get("response_mime_type") == "application/json":
+            params["response_format"] = {"type": "json_object"}
+        return params
+
+    @staticmethod
+    def _response(completion):
+        usage = completion.usage
+        return _TextResponse(
+            completion.choices[0].message.content,
+            _Usage(usage.prompt_tokens, usage.completion_tokens) if usage else None,
+        )
+
+    async def generate_content_async(self, prompt, stream=False, generation_config=None, **kwargs):
+        completion = await self._async_client.chat.completions.create(**self._params(prompt, generation_config))
+        return self._response(completion)
+
+
+
+def _build_model(settings):
+    provider = settings.get("provider", "gemini")
+    if provider == "gemini":
+        # google.generativeai pulls in grpc and protobuf; import it on first use only
+        import google.generativeai as genai
+
+        genai.configure(api_key=GOOGLE_API_KEY)
+        return genai.GenerativeModel(settings.get("model", GEMINI_MODEL_NAME))
+    if provider == "groq":
+        return GroqModel(settings["model"], settings.get("api_key"))
+    if provider == "fake":
+        from llm_gateway.fake import FakeModel
+
+        options = {k: v for k, v in settings.items() if k not in ("provider", "model")}
+        return FakeModel(**options)
+    raise ValueError(f"Unknown LLM provider: {provider}")
+
+
+class Tier:
+    """One provider/model pairing, built on first use, with its recent latencies."""
+
+    def __init__(self, name, settings):
+        self.name = name
+        self.settings = settings
+        self.provider = settings.get("provider", "gemini")
+        self.model_name = settings.get("model", GEMINI_MODEL_NAME)
+        self._model = None
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self.counters = {"calls": 0, "errors": 0}
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = _build_model(self.settings)
+        return self._model
+
+    async def load(self):
+        """
+        Like `model`, but builds the client in a worker thread: the first
+        google.generativeai import takes seconds and would stall the event loop.
+        """
+        if self._model is None:
+            model = await asyncio.to_thread(_build_model, self.settings)
+            if self._model is None:  # not installed with set_model in the meantime
+                self._model = model
+        return self._model
+
+    def set_model(self, model):
+        self._model = model
+
+    def record(self, seconds, ok=True):
+        self.counters["calls"] += 1
+        if ok:
+            self._latencies.append(seconds)
+        else:
+            self.counters["errors"] += 1
+        tier_latency_seconds.observe(seconds, tier=self.name, status="ok" if ok else "error")
+
+    def percentile(self, q):
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+    def stats(self):
+        p50, p95, p99 = (self.percentile(q) for q in (50, 95, 99))
+        return {
+            "provider": self.provider,
+            "model": self.model_name,
+            **self.counters,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "p99_ms": round(p99 * 1000, 1) if p99 is not None else None,
+        }
+
+
+class ModelRouter:
+    """
+    Assigns each call type to a model tier and, for call types with a hedge
+    tier, sends a duplicate request there once the primary has run past its
+    recent p95 latency. Whichever answers successfully first wins and the
+    other request is cancelled. The hedge goes through admission control like
+    any other call, but is skipped rather than queued when no token is free.
+
+    With no LLM_TIERS configured there is a single "default" tier running
+    GEMINI_MODEL_NAME, and every call goes there unhedged.
+    """
+
+    def __init__(self, tiers=None, routes=None, hedges=None):
+        tiers = dict(tiers or LLM_TIERS)
+        tiers.setdefault(DEFAULT_TIER, {"provider": "gemini", "model": GEMINI_MODEL_NAME})
+        self.tiers = {name: Tier(name, settings) for name, settings in tiers.items()}
+        self.routes = dict(LLM_ROUTES if routes is None else routes)
+        self.hedges = dict(LLM_HEDGES if hedges is None else hedges)
+        self.counters = {"hedges_sent": 0, "hedge_wins": 0}
+
+    def tier_for(self, call_type):
+        return self.tiers[self.routes.get(call_type, DEFAULT_TIER)]
+
+    def hedge_for(self, call_type):
+        name = self.hedges.get(call_type)
+        return self.tiers[name] if name is not None else None
+
+    def set_model(self, model, tier=None):
+        """Installs `model` (e.g. a FakeModel) on one tier, or on every tier."""
+        for name, t in self.tiers.items():
+            if tier is None or name == tier:
+                t.set_model(model)
+
+    async def load_models(self):
+        """Builds every tier's client off the event loop; run at startup."""
+        await asyncio.gather(*(tier.load() for tier in self.tiers.values()))
+
+    def hedge_delay(self, tier):
+        if len(tier._latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return LLM_HEDGE_DEFAULT_DELAY_SECONDS
+        return tier.percentile(LLM_HEDGE_PERCENTILE)
+
+    async def _timed_call(self, tier, prompt, timeout, kwargs):
+        start = time.perf_counter()
+        try:
+            model = await tier.load()
+            response = await asyncio.wait_for(model.generate_content_async(prompt, **kwargs), timeout)
+        except asyncio.CancelledError:
+            raise  # lost a hedge race; not an error of the tier
+        except Exception:
+            tier.record(time.perf_counter() - start, ok=False)
+            raise
+        tier.record(time.perf_counter() - start)
+        return response
+
+    async def call(self, call_type, prompt, timeout, **kwargs):
+        """Returns the first successful response for `prompt`, hedging when configured."""
+        primary = self.tier_for(call_type)
+        hedge = self.hedge_for(call_type)
+        if hedge is None or hedge is primary:
+            return await self._timed_call(primary, prompt, timeout, kwargs)
+
+        first = asyncio.ensure_future(self._timed_call(primary, prompt, timeout, kwargs))
+        pending = {first}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=self.hedge_delay(primary))
+            if done:
+                return first.result()
+            # The duplicate is a call of its own and needs its own admission token
+            if not admission.try_acquire():
+                hedged_requests.inc(call_type=call_type, outcome="no_token")
+                return await first
+
+            self.counters["hedges_sent"] += 1
+            second = asyncio.ensure_future(self._timed_call(hedge, prompt, timeout, kwargs))
+            pending = {first, second}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        won = task is second
+                        self.counters["hedge_wins"] += won
+                        hedged_requests.inc(call_type=call_type, outcome="hedge_won" if won else "primary_won")
+                        return task.result()
+                    error = task.exception()
+            hedged_requests.inc(call_type=call_type, outcome="both_failed")
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self):
+        return {
+            "routes": self.routes,
+            "hedges": self.hedges,
+            **self.counters,
+            "hedge_delays_ms": {
+                call_type: round(self.hedge_delay(self.tier_for(call_type)) * 1000, 1) for call_type in self.hedges
+            },
+            "tiers": {name: tier.stats() for name, tier in self.tiers.items()},
+        }
+
+
+router = ModelRouter()
@@ -0,0 +1,286 @@
+import ast
+import json
+import re
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+from helper_functions.metrics import llm_calls
+from llm_gateway.cache import llm_cache, LLM_CACHE_DISABLED
+from llm_gateway.gateway import cache_key, generate_content_async, stream_content_async
+
+
+JSON_MODE = {"response_mime_type": "application/json"}
+
+_fence = re.compile(r"^```[a-zA-Z]*\s*|\s*```$")
+_trailing_comma = re.compile(r",\s*([}\]])")
+_smart_quotes = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+
+counters = {"calls": 0, "parse_failures": 0, "repairs": 0, "repair_failures": 0}
+
+
+class StructuredOutputError(ValueError):
+    pass
+
+
+def _loads(text):
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def _outermost(text):
+    # The first {...} or [...] span, for replies wrapped in prose
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        return None
+    start = min(starts)
+    end = text.rfind("}" if text[start] == "{" else "]")
+    return text[start:end + 1] if end > start else None
+
+
+def parse_json_payload(text):
+    """
+    Parses model output into Python data without ever executing it: strips
+    markdown fences, isolates the outermost JSON object/array, repairs trailing
+    commas and smart quotes, and finally accepts Python-literal syntax
+    (single quotes, True/False) via ast.literal_eval.
+    """
+    cleaned = _fence.sub("", text.strip()).strip()
+    attempts = [cleaned]
+    span = _outermost(cleaned)
+    if span and span != cleaned:
+        attempts.append(span)
+
+    for candidate in attempts:
+        repaired = _trailing_comma.sub(r"\1", candidate.translate(_smart_quotes))
+        for attempt in (candidate, repaired):
+            try:
+                return _loads(attempt)
+            except ValueError:
+                pass
+        try:
+            return ast.literal_eval(repaired)
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            pass
+    raise StructuredOutputError(f"Could not parse model output as JSON: {text[:200]!r}")
+
+
+class JSONMemberStream:
+    """
+    Incremental scanner over a JSON object arriving in chunks: `feed` returns
+    the (key, value) pairs of the top-level members that have closed since the
+    last call. Text before the opening brace (a fence, prose) is skipped. A
+    member that doesn't parse on its own ends the scan; the complete text is
+    still parsed, and repaired, as usual once the stream is over.
+    """
+
+    def __init__(self):
+        self._member = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._closed = False
+
+    def feed(self, chunk):
+        members = []
+        for c in chunk:
+            if self._closed:
+                break
+            if self._depth == 0:
+                self._depth = int(c == "{")
+                continue
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif c == "\\":
+                    self._escaped = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c in "{[":
+                self._depth += 1
+            elif c in "}]":
+                self._depth -= 1
+            if self._depth == 0 or (self._depth == 1 and c == "," and not self._in_string):
+                self._closed = self._depth == 0
+                members.extend(self._finish_member())
+            else:
+                self._member.append(c)
+        return members
+
+    def _finish_member(self):
+        text = "".join(self._member).strip()
+        self._member = []
+        if not text:
+            return []
+        try:
+            return list(_loads("{" + text + "}").items())
+        except ValueError:
+            self._closed = True
+            return []
+
+
+def _fields(model_cls):
+    return model_cls.model_fields if hasattr(model_cls, "model_fields") else model_cls.__fields__
+
+
+def validate_field(model_cls, name, value):
+    """Validates one field of `model_cls` on its own and returns the converted value."""
+    if hasattr(model_cls, "model_construct"):
+        instance = model_cls.model_construct()
+        try:
+            model_cls.__pydantic_validator__.validate_assignment(instance, name, value)
+        except ValueError as e:
+            raise StructuredOutputError(str(e)) from e
+        return getattr(instance, name)
+    value, error = model_cls.__fields__[name].validate(value, {}, loc=name)  # pydantic v1
+    if error:
+        raise StructuredOutputError(str(error))
+    return value
+
+
+def _validate(model_cls, data, list_field=None):
+    if list_field is not None and isinstance(data, list):
+        data = {list_field: data}
+    if hasattr(model_cls, "model_validate"):
+        return model_cls.model_validate(data)
+    return model_cls.parse_obj(data)  # pydantic v1
+
+
+def parse_structured(text, model_cls, list_field=None, check=None):
+    """
+    Parses and validates `text` into `model_cls`. `list_field` lets a bare JSON
+    array stand in for an object with that single list field, and `check`
+    can reject a validated result by raising ValueError.
+    """
+    try:
+        result = _validate(model_cls, parse_json_payload(text), list_field)
+        if check is not None:
+            check(result)
+        return result
+    except ValueError as e:  # pydantic's ValidationError is a ValueError too
+        raise StructuredOutputError(str(e)) from e
+
+
+def _repair_prompt(text, model_cls, error):
+    schema = model_cls.model_json_schema() if hasattr(model_cls, "model_json_schema") else model_cls.schema()
+    return f"""The following output should have been a single JSON object matching this JSON schema:
+{json.dumps(schema)}
+
+It failed with: {error}
+
+Output:
+{text}
+
+Return ONLY the corrected JSON object, with no other text.
+"""
+
+
+async def generate_structured_async(prompt, model_cls, call_type="default", list_field=None, check=None,
+                                    bypass_cache=False, **kwargs):
+    """
+    Requests JSON output from Gemini and returns it validated as `model_cls`.
+    On a parse/validation failure one cheap repair call is made with the bad
+    output; if that fails too, StructuredOutputError is raised.
+
+    Caching happens here rather than in the gateway, and only for replies that
+    parsed: a malformed completion is never pinned in the cache for its TTL.
+    A successful repair is cached under the original prompt.
+    """
+    counters["calls"] += 1
+    kwargs["generation_config"] = JSON_MODE
+    key = None if bypass_cache or LLM_CACHE_DISABLED else cache_key(prompt, call_type, kwargs)
+    if key is not None:
+        cached = await llm_cache.get(key)
+        if cached is not None:
+            try:
+                result = parse_structured(cached, model_cls, list_field, check)
+                llm_calls.inc(call_type=call_type, outcome="cache_hit")
+                return result
+            except StructuredOutputError:
+                pass  # e.g. cached before `check` got stricter; ask again
+
+    text = await generate_content_async(prompt, call_type=call_type, bypass_cache=True, **kwargs)
+    return await _parse_or_repair(text, key, model_cls, call_type, list_field, check)
+
+
+async def _parse_or_repair(text, key, model_cls, call_type, list_field=None, check=None):
+    try:
+        result = parse_structured(text, model_cls, list_field, check)
+    except StructuredOutputError as e:
+        counters["parse_failures"] += 1
+        print(f"Structured output parse failed for {call_type}, attempting repair: {e}")
+        error = e
+    else:
+        if key is not None:
+            llm_cache.set(key, text, call_type)
+        return result
+
+    counters["repairs"] += 1
+    repaired = await generate_content_async(
+        _repair_prompt(text, model_cls, error), call_type=call_type, bypass_cache=True, generation_config=JSON_MODE
+    )
+    try:
+        result = parse_structured(repaired, model_cls, list_field, check)
+    except StructuredOutputError:
+        counters["repair_failures"] += 1
+        raise
+    if key is not None:
+        llm_cache.set(key, repaired, call_type)
+    return result
+
+
+async def stream_structured_async(prompt, model_cls, call_type="default", bypass_cache=False, **kwargs):
+    """
+    Streaming counterpart of generate_structured_async for a JSON object:
+    yields (field, value) for each field of `model_cls` as soon as the model
+    has closed it in the stream and it validates on its own. Once the stream
+    ends the whole object is validated (and repaired like in
+    generate_structured_async), and the fields not sent yet follow, defaults
+    included. Raises StructuredOutputError if the object can't be repaired.
+    """
+    counters["calls"] += 1
+    kwargs["generation_config"] = JSON_MODE
+    key = None if bypass_cache or LLM_CACHE_DISABLED else cache_key(prompt, call_type, kwargs)
+    result = None
+    if key is not None:
+        cached = await llm_cache.get(key)
+        if cached is not None:
+            try:
+                result = parse_structured(cached, model_cls)
+                llm_calls.inc(call_type=call_type, outcome="cache_hit")
+            except StructuredOutputError:
+                pass
+
+    fields = _fields(model_cls)
+    sent = set()
+    if result is None:
+        members = JSONMemberStream()
+        parts = []
+        async for chunk in stream_content_async(prompt, call_type=call_type, bypass_cache=True, **kwargs):
+            parts.append(chunk)
+            for name, value in members.feed(chunk):
+                if name not in fields or name in sent:
+                    continue
+                try:
+                    value = validate_field(model_cls, name, value)
+                except StructuredOutputError:
+                    continue  # the repair below deals with it
+                sent.add(name)
+                yield name, value
+        result = await _parse_or_repair("".join(parts), key, model_cls, call_type)
+    for name in fields:
+        if name not in sent:
+            yield name, getattr(result, name)
+
+
+def structured_stats():
+    calls = counters["calls"]
+    return {
+        **counters,
+        "parse_failure_rate": round(counters["parse_failures"] / calls, 4) if calls else 0.0,
+    }
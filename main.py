@@ -1,24 +1,47 @@
-from fastapi import FastAPI, HTTPException, Body
+from helper_functions.startup import startup_timer
+import helper_functions.config  # reads .env before any module looks up its settings
+from fastapi import FastAPI, HTTPException, Body, Query
 from fastapi.middleware.cors import CORSMiddleware 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Dict, Union
+import asyncio
+import json
 import os
-from dotenv import load_dotenv
-import google.generativeai as genai
 from fastapi import WebSocket, WebSocketDisconnect
-from fastapi.responses import FileResponse
+from fastapi import Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+import time
+import uuid
 
 
-from symptom_processing.symptom import hybrid_symptom_extraction
+from symptom_processing.symptom import hybrid_symptom_extraction_async
 from Followup_Generation.followup import get_followup_for_diagnosis
-from symptom_mapping.mapping import get_disease_symptom_mapping
-from diagnosis_report.report import final_report
-from helper_functions.helper import convert_to_pdf
+from Followup_Generation.prefetch import followup_prefetcher
+from Followup_Generation.rules import followup_rules
+from symptom_mapping.mapping import start_speculative_mapping, get_session_mapping, preliminary_differential
+from symptom_mapping.disease_index import disease_index
+from diagnosis_report.report import final_report, stream_final_report
+from helper_functions.helper import IncrementalPDF
+from helper_functions.pdf_cache import pdf_cache, render_report_pdf, report_hash, run_on_render_pool
+from helper_functions.static_assets import static_assets
+from symptom_processing.nlp_model import model_stats
+from symptom_processing.extraction_service import extraction_service
+from llm_gateway.cache import llm_cache
+from llm_gateway.admission import (
+    admission, AdmissionRejected, llm_priority, PRIORITY_FOLLOWUP, PRIORITY_INTAKE, PRIORITY_REPORT
+)
+from llm_gateway.gateway import validate_model
+from llm_gateway.routing import router
+from llm_gateway.structured import structured_stats
+from session_backend.store import create_session_store
+from batch_consultation.runner import BatchRunner, read_records, BATCH_MAX_CONCURRENCY
+from helper_functions.metrics import (
+    registry, http_request_seconds, active_websockets, request_id_var, session_id_var, log_event
+)
 
-load_dotenv()
+startup_timer.mark("imports")
 
-google_api_key = os.getenv("GOOGLE_API_KEY")
-genai.configure(api_key=google_api_key)
+NLP_WARMUP = os.getenv("NLP_WARMUP", "1") == "1"
 
 
 app = FastAPI()
@@ -33,7 +56,246 @@ app.add_middleware(
 )
 
 
-session_store = {}
+session_store = create_session_store()
+
+
+@app.middleware("http")
+async def request_metrics(request: Request, call_next):
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    request_id_var.set(request_id)
+    session_id_var.set(_session_from_path(request.url.path))
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        route = request.scope.get("route")
+        route = route.path if route is not None else "unmatched"
+        http_request_seconds.observe(elapsed, method=request.method, route=route, status=status)
+        log_event("http_request", method=request.method, route=route, status=status,
+                  duration_ms=round(elapsed * 1000, 2))
+
+
+def _session_from_path(path):
+    # Routes carry the session as their last path segment, e.g. /generate_report/{session_id}
+    if path.startswith("/static/"):
+        return None
+    parts = path.rstrip("/").split("/")
+    return parts[-1] if len(parts) > 2 else None
+
+
+def _cache_hit_rate():
+    return llm_cache.stats()["hit_rate"]
+
+
+registry.gauge("llm_cache_entries", "Entries in the in-memory LLM response cache",
+               callback=lambda: llm_cache.stats()["entries"])
+registry.gauge("llm_cache_hit_rate", "LLM response cache hit rate", callback=_cache_hit_rate)
+registry.gauge("llm_structured_parse_failures", "Structured LLM replies that failed to parse",
+               callback=lambda: structured_stats()["parse_failures"])
+registry.gauge("extraction_queue_depth", "Texts waiting for the NER batcher",
+               callback=lambda: extraction_service.stats()["queue_depth"])
+registry.gauge("followup_prefetch_in_flight", "Speculative follow-up calls in flight",
+               callback=lambda: followup_prefetcher.stats()["in_flight"])
+registry.gauge("followup_rules_local_fraction", "Follow-up turns answered by the local rule table",
+               callback=lambda: followup_rules.stats()["local_fraction"])
+registry.gauge("sessions", "Sessions held by the in-memory session store",
+               callback=lambda: session_store.stats().get("sessions", 0))
+registry.gauge("pdf_cache_entries", "Rendered PDFs held in the PDF cache",
+               callback=lambda: pdf_cache.stats()["entries"])
+registry.gauge("llm_admission_queue_depth", "LLM calls waiting for a rate-limit token",
+               callback=lambda: admission.stats()["queue_depth"])
+
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    retry_after = max(1, round(exc.retry_after))
+    return JSONResponse({"detail": "Server is busy, please retry shortly", "retry_after": retry_after},
+                        status_code=429, headers={"Retry-After": str(retry_after)})
+
+
+_warmup_task = None
+_llm_load_task = None
+
+
+@app.on_event("startup")
+async def load_followup_rules():
+    with startup_timer.phase("load_followup_rules"):
+        followup_rules.load()
+
+
+async def _warm_extraction_workers():
+    with startup_timer.phase("nlp_warmup"):
+        await extraction_service.warm()
+    log_event("nlp_warmup_done", **startup_timer.report())
+
+
+@app.on_event("startup")
+async def start_extraction_service():
+    # Workers load scispaCy in the background so the process accepts connections
+    # right away; /ready stays 503 until they are warm
+    global _warmup_task
+    with startup_timer.phase("start_extraction_service"):
+        await extraction_service.start(warm=False)
+    if NLP_WARMUP:
+        _warmup_task = asyncio.create_task(_warm_extraction_workers())
+
+
+async def _load_llm_clients():
+    with startup_timer.phase("llm_client_load"):
+        try:
+            await router.load_models()
+        except Exception as e:
+            # The first LLM call retries building the client and reports the error
+            log_event("llm_client_load_failed", error=str(e))
+
+
+@app.on_event("startup")
+async def start_llm_client_load():
+    # Importing google.generativeai takes seconds; do it in a worker thread so
+    # the first consultation doesn't block the event loop on it
+    global _llm_load_task
+    _llm_load_task = asyncio.create_task(_load_llm_clients())
+
+
+@app.on_event("startup")
+async def load_static_assets():
+    with startup_timer.phase("load_static_assets"):
+        static_assets.load()
+
+
+@app.on_event("startup")
+async def load_disease_index():
+    with startup_timer.phase("load_disease_index"):
+        try:
+            disease_index.load()
+        except Exception as e:
+            # Mapping still works without the shortlist; the first query retries the load
+            log_event("disease_index_load_failed", error=str(e))
+
+
+@app.on_event("startup")
+async def report_startup():
+    startup_timer.mark("startup_hooks")
+    log_event("startup", **startup_timer.report())
+
+
+@app.on_event("shutdown")
+async def stop_extraction_service():
+    await extraction_service.stop()
+
+
+@app.get("/health")
+async def health():
+    """Liveness: the process is up and serving, nothing more."""
+    return {"status": "ok"}
+
+
+async def _session_store_reachable():
+    try:
+        return await session_store.ping()
+    except Exception as e:
+        log_event("session_store_ping_failed", error=str(e))
+        return False
+
+
+@app.get("/ready")
+async def readiness():
+    """
+    Readiness: the follow-up rules are loaded, the NER workers are warm, the
+    Gemini model has been validated once and the session store answers.
+    """
+    model_status = await validate_model()
+    checks = {
+        "followup_rules": followup_rules.loaded,
+        "nlp_workers": extraction_service.warmed or not NLP_WARMUP,
+        "llm_model": model_status["validated"],
+        "session_store": await _session_store_reachable(),
+    }
+    ready = all(checks.values())
+    if ready:
+        startup_timer.mark_ready()
+    body = {"ready": ready, "checks": checks, "llm_model_error": model_status["error"],
+            "startup": startup_timer.report()}
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+
+def _static_response(request, name):
+    result = static_assets.respond(name, request.headers, version=request.query_params.get("v"))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    status, body, headers = result
+    return Response(body, status_code=status, headers=headers)
+
+
+@app.get("/")
+async def index(request: Request):
+    return _static_response(request, "symptom.html")
+
+
+@app.get("/static/{name}")
+async def get_static_asset(request: Request, name: str):
+    """The html/ frontend, precompressed and served with ETags; see helper_functions.static_assets."""
+    return _static_response(request, name)
+
+
+@app.get("/static_assets")
+async def get_static_assets_stats():
+    return static_assets.stats()
+
+
+@app.get("/nlp_model")
+async def get_nlp_model_stats():
+    return {"process": model_stats(), "extraction_service": extraction_service.stats()}
+
+
+@app.get("/llm_cache")
+async def get_llm_cache_stats():
+    return llm_cache.stats()
+
+
+@app.get("/llm_structured")
+async def get_llm_structured_stats():
+    return structured_stats()
+
+
+@app.get("/followup_prefetch")
+async def get_followup_prefetch_stats():
+    return followup_prefetcher.stats()
+
+
+@app.get("/followup_rules")
+async def get_followup_rules_stats():
+    return followup_rules.stats()
+
+
+@app.get("/session_store")
+async def get_session_store_stats():
+    return session_store.stats()
+
+
+@app.get("/llm_admission")
+async def get_llm_admission_stats():
+    return admission.stats()
+
+
+@app.get("/llm_routing")
+async def get_llm_routing_stats():
+    return router.stats()
+
+
+@app.get("/disease_index")
+async def get_disease_index_stats():
+    return disease_index.stats()
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 class PatientInfo(BaseModel):
     name: str
@@ -43,23 +305,27 @@ class PatientInfo(BaseModel):
  
 @app.post("/symptom")
 async def submit_symptom(patient: PatientInfo):
+    llm_priority.set(PRIORITY_INTAKE)
     try:
-        symptoms = hybrid_symptom_extraction(patient.symptoms)
+        symptoms = await hybrid_symptom_extraction_async(patient.symptoms)
 
        
-        import uuid
         session_id = str(uuid.uuid4()) 
+        session_id_var.set(session_id)
 
        
-        session_store[session_id] = {
+        await session_store.save(session_id, {
             "name": patient.name, 
             "age": patient.age,
             "gender": patient.gender,
             "symptoms": symptoms,
             "chat_history": []
-        }
+        })
 
-        return {"message": "Symptoms received", "status": "symptom_submitted", "session_id": session_id}
+        return {"message": "Symptoms received", "status": "symptom_submitted", "session_id": session_id,
+                "preliminary": preliminary_differential(symptoms)}
+    except AdmissionRejected:
+        raise
     except Exception as e:
         print(f"Error processing symptom submission: {e}")
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {e}")
@@ -67,128 +333,440 @@ async def submit_symptom(patient: PatientInfo):
 
 @app.get("/session/{session_id}")
 async def get_session_data(session_id: str):
-    if session_id not in session_store:
+    session = await session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
+
+@app.get("/preliminary/{session_id}")
+async def get_preliminary_differential(session_id: str):
+    """Instant ranked shortlist from the local disease index; no LLM call."""
+    session = await session_store.get(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="Session not found")
-    return session_store[session_id]
+    return {"session_id": session_id,
+            "preliminary": preliminary_differential(session["symptoms"], session["chat_history"])}
+
+
 
+followup_resumes = registry.counter(
+    "followup_resumes_total", "Follow-up reconnects and resent answers handled without the LLM", labels=("kind",)
+)
+
+READY_MESSAGE = {"message": "Diagnosis is ready", "status": "ready_for_diagnosis"}
+MAX_QUESTIONS_MESSAGE = {"message": "Reached max questions, moving to diagnosis.", "status": "ready_for_diagnosis"}
+
+
+def question_message(question, seq, replayed=False):
+    """The websocket message for follow-up question number `seq`."""
+    return {
+        "question": question["Question"],
+        "options": [
+            {"key": k, "value": v}
+            for k, v in question.items() if k in ["A", "B", "C", "D"]
+        ],
+        "status": "waiting_for_answer",
+        "seq": seq,
+        "replayed": replayed,
+    }
+
+
+def parse_answer(raw):
+    # Clients send {"seq": n, "answer": "A"}; a bare "A" answers the pending question
+    try:
+        message = json.loads(raw)
+    except ValueError:
+        message = None
+    if isinstance(message, dict) and "answer" in message:
+        return str(message["answer"]).strip().upper(), message.get("seq")
+    return raw.strip().upper(), None
 
 
 @app.websocket("/followup/{session_id}")
 async def followup_question(websocket: WebSocket, session_id: str):
+    """
+    Follow-up Q&A. Each question carries a sequence number `seq`; answers may
+    echo it back so that an answer resent after a brief disconnect is not
+    applied twice. Reconnecting to a session replays its pending question from
+    session["last_options"] (or the ready message) without calling Gemini.
+    """
     await websocket.accept()
+    request_id_var.set(uuid.uuid4().hex)
+    session_id_var.set(session_id)
+    llm_priority.set(PRIORITY_FOLLOWUP)
+    active_websockets.inc()
     try:
-        if session_id not in session_store:
+        session = await session_store.get(session_id)
+        if session is None:
             await websocket.send_json({"error": "Invalid session_id"})
             await websocket.close()
             return
 
-        session = session_store[session_id]
         age, gender, symptoms = session["age"], session["gender"], session["symptoms"]
         chat_history = session["chat_history"]
+
+        async def finish(message):
+            session["status"] = "ready_for_diagnosis"
+            await session_store.save(session_id, session)
+            start_speculative_mapping(session_id, session, update=session_store.update)
+            await websocket.send_json(message)
+            await websocket.close()
+
+        async def ask(response):
+            session["question_count"] = session.get("question_count", 0) + 1
+            session["last_options"] = response  # Save last options for later
+            chat_history.append({"bot": response["Question"]})
+            await session_store.save(session_id, session)
+            await websocket.send_json(question_message(response, session["question_count"]))
+            followup_prefetcher.prefetch(session_id, age, gender, symptoms, chat_history, response)
+
+        async def advance(answer_key):
+            """Produces the next step after the latest answer; returns True once the Q&A is over."""
+            response = followup_rules.answer(symptoms, chat_history)
+            if response is None:
+                response = await followup_prefetcher.next_followup(
+                    session_id, answer_key, age, gender, symptoms, chat_history,
+                    token_log=session.setdefault("prompt_tokens", [])
+                )
+            else:
+                followup_prefetcher.cancel(session_id)
+
+            if isinstance(response, str) and "ready for diagnosis" in response.lower():
+                await finish(READY_MESSAGE)
+                return True
+
+            elif isinstance(response, dict) and "Question" in response:
+                if session["question_count"] >= 10:
+                    await finish(MAX_QUESTIONS_MESSAGE)
+                    return True
+                await ask(response)
+
+            elif isinstance(response, str) and "error" in response.lower():
+                await session_store.save(session_id, session)
+                await websocket.send_json({"error": response})
+            else:
+                await session_store.save(session_id, session)
+                await websocket.send_json({"error": "Unexpected response format"})
+            return False
+
         question_count = session.get("question_count", 0)
 
-        
+        if session.get("status") == "ready_for_diagnosis":
+            # The Q&A already finished; the client only missed the final message
+            followup_resumes.inc(kind="ready")
+            await websocket.send_json(READY_MESSAGE)
+            await websocket.close()
+            return
+
         if question_count == 0:
-            response = get_followup_for_diagnosis(age, gender, symptoms, chat_history)
+            # Common opening questions come from the local table; the LLM only when it has no answer
+            response = followup_rules.answer(symptoms, chat_history)
+            if response is None:
+                try:
+                    response = await get_followup_for_diagnosis(
+                        age, gender, symptoms, chat_history, token_log=session.setdefault("prompt_tokens", [])
+                    )
+                except AdmissionRejected as e:
+                    # Nothing was asked yet, so reconnecting later starts cleanly
+                    await websocket.send_json({"error": "Server is busy, please retry shortly",
+                                               "status": "busy", "retry_after": round(e.retry_after)})
+                    await websocket.close(code=1013)  # "try again later"
+                    return
             if isinstance(response, dict) and "Question" in response:
-                session["question_count"] = 1
-                session["last_options"] = response  # Save last options for later
-                chat_history.append({"bot": response["Question"]})
-                await websocket.send_json({
-                    "question": response["Question"],
-                    "options": [
-                        {"key": k, "value": v}
-                        for k, v in response.items() if k in ["A", "B", "C", "D"]
-                    ],
-                    "status": "waiting_for_answer"
-                })
+                await ask(response)
             else:
                 await websocket.send_json({"error": "Unable to generate initial question."})
                 await websocket.close()
                 return
 
-        
+        elif session.get("answered_seq", 0) < question_count and session.get("last_options"):
+            # Reconnect with a question pending: replay it rather than asking Gemini again
+            followup_resumes.inc(kind="replayed")
+            last_options = session["last_options"]
+            await websocket.send_json(question_message(last_options, question_count, replayed=True))
+            followup_prefetcher.prefetch(session_id, age, gender, symptoms, chat_history, last_options)
+
+        else:
+            # The last answer was recorded but the connection dropped before the next
+            # question went out; pick up from that answer
+            followup_resumes.inc(kind="after_answer")
+            try:
+                if await advance(None):
+                    return
+            except AdmissionRejected as e:
+                await websocket.send_json({"error": "Server is busy, please retry shortly",
+                                           "status": "busy", "retry_after": round(e.retry_after)})
+                await websocket.close(code=1013)
+                return
+
         while True:
-            client_msg = await websocket.receive_text()
-            client_msg = client_msg.strip().upper()
+            client_msg, seq = parse_answer(await websocket.receive_text())
+            question_count = session.get("question_count", 0)
+
+            if seq is not None and seq != question_count:
+                # A resend of an answer already applied, or an answer to a stale
+                # question: don't record it twice, just show the pending question again
+                followup_resumes.inc(kind="duplicate")
+                await websocket.send_json(question_message(session["last_options"], question_count, replayed=True))
+                continue
+
+            if session.get("answered_seq", 0) >= question_count:
+                # The answer to this question is already in the history but the next step
+                # failed (an LLM or parse error): a resend retries that step, it isn't a new answer
+                followup_resumes.inc(kind="retry")
+                try:
+                    if await advance(client_msg):
+                        break
+                except AdmissionRejected as e:
+                    await websocket.send_json({"error": "Server is busy, please send your answer again shortly",
+                                               "status": "busy", "retry_after": round(e.retry_after)})
+                continue
 
             last_response = session.get("last_options", {})
             user_answer = last_response.get(client_msg, client_msg)
 
-            
             chat_history.append({"user": user_answer})
+            session["answered_seq"] = question_count
 
-            response = get_followup_for_diagnosis(age, gender, symptoms, chat_history)
-
-            if isinstance(response, str) and "ready for diagnosis" in response.lower():
-                await websocket.send_json({
-                    "message": "Diagnosis is ready",
-                    "status": "ready_for_diagnosis"
-                })
-                await websocket.close()
-                break
-
-            elif isinstance(response, dict) and "Question" in response:
-                session["question_count"] += 1
-                session["last_options"] = response  # Update last options
-
-                if session["question_count"] > 10:
-                    await websocket.send_json({
-                        "message": "Reached max questions, moving to diagnosis.",
-                        "status": "ready_for_diagnosis"
-                    })
-                    await websocket.close()
+            try:
+                if await advance(client_msg):
                     break
-
-                chat_history.append({"bot": response["Question"]})
-                await websocket.send_json({
-                    "question": response["Question"],
-                    "options": [
-                        {"key": k, "value": v}
-                        for k, v in response.items() if k in ["A", "B", "C", "D"]
-                    ],
-                    "status": "waiting_for_answer"
-                })
-
-            elif isinstance(response, str) and "error" in response.lower():
-                await websocket.send_json({"error": response})
-            else:
-                await websocket.send_json({"error": "Unexpected response format"})
+            except AdmissionRejected as e:
+                # Forget this answer so the patient can simply send it again
+                chat_history.pop()
+                session["answered_seq"] = question_count - 1
+                await websocket.send_json({"error": "Server is busy, please send your answer again shortly",
+                                           "status": "busy", "retry_after": round(e.retry_after)})
 
     except WebSocketDisconnect:
         print(f"Session {session_id} disconnected.")
     except Exception as e:
         await websocket.send_json({"error": str(e)})
         await websocket.close()
+    finally:
+        active_websockets.dec()
+        followup_prefetcher.end_session(session_id)
+
+
 
+PDF_CHUNK_SIZE = 64 * 1024
+
+
+def pdf_response(pdf_bytes):
+    def chunks():
+        for start in range(0, len(pdf_bytes), PDF_CHUNK_SIZE):
+            yield pdf_bytes[start:start + PDF_CHUNK_SIZE]
+
+    return StreamingResponse(chunks(), media_type="application/pdf", headers={
+        "Content-Disposition": 'attachment; filename="medical_report.pdf"',
+        "Content-Length": str(len(pdf_bytes)),
+    })
 
 
 @app.get("/generate_report/{session_id}")
 async def generate_report(session_id: str):
+    llm_priority.set(PRIORITY_REPORT)
     try:
-        if session_id not in session_store:
+        session = await session_store.get(session_id)
+        if session is None:
             raise HTTPException(status_code=404, detail="Session not found")
 
-        session = session_store[session_id]
         name = session.get("name", "Unknown")
         age = session["age"]
         gender = session["gender"]
         symptoms = session["symptoms"]
         chat_history = session["chat_history"]
 
-        # Get mapped diseases and final report
-        mapped_diseases = get_disease_symptom_mapping(age, gender, symptoms, chat_history)
-        report = final_report(age, gender, symptoms, chat_history, mapped_diseases)
+        # Get mapped diseases (usually precomputed during follow-up) and final report
+        mapped_diseases = await get_session_mapping(session_id, session, update=session_store.update)
+        report = await final_report(age, gender, symptoms, chat_history, mapped_diseases)
+        # Kept on the session so /report_pdf works on any worker, not just this one's PDF cache
+        session["report"] = report
+        await session_store.update(session_id, {"report": report})
 
-        # Generate the PDF
-        output_pdf_path = "medical_report.pdf"
-        success = convert_to_pdf(report, output_pdf_path)
-
-        if success:
-            return FileResponse(output_pdf_path, filename="medical_report.pdf", media_type='application/pdf')
-        else:
-            raise HTTPException(status_code=500, detail="Failed to generate PDF")
+        # Render the PDF in memory off the event loop (cached per session + report)
+        pdf_bytes = await render_report_pdf(session_id, report)
+        return pdf_response(pdf_bytes)
 
+    except AdmissionRejected:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@app.get("/generate_report_stream/{session_id}")
+async def generate_report_stream(session_id: str):
+    """
+    Streams the report as Server-Sent Events while it is generated: the patient
+    header first, then each section as soon as the model has written it. Each
+    chunk is sent as a `data:` event and laid out into the PDF as it arrives; a
+    final `done` event carries the URL of the finished PDF.
+    """
+    session = await session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    age = session["age"]
+    gender = session["gender"]
+    symptoms = session["symptoms"]
+    chat_history = session["chat_history"]
+
+    async def events():
+        llm_priority.set(PRIORITY_REPORT)
+        try:
+            mapped_diseases = await get_session_mapping(session_id, session, update=session_store.update)
+            pdf = IncrementalPDF()
+            parts = []
+            async for chunk in stream_final_report(age, gender, symptoms, chat_history, mapped_diseases):
+                pdf.add_text(chunk)
+                parts.append(chunk)
+                yield f"data: {json.dumps({'chunk': chunk})}\n\n"
+            # Compression and output() are the expensive part; keep them off the event loop
+            pdf_bytes = await run_on_render_pool(pdf.finish)
+            report = "".join(parts)
+            pdf_cache.put(session_id, report_hash(report), pdf_bytes)
+            session["report"] = report
+            await session_store.update(session_id, {"report": report})
+            yield f"event: done\ndata: {json.dumps({'pdf_url': f'/report_pdf/{session_id}'})}\n\n"
+        except AdmissionRejected as e:
+            yield f"event: error\ndata: {json.dumps({'error': 'Server is busy', 'retry_after': round(e.retry_after)})}\n\n"
+        except Exception as e:
+            print(f"Error streaming report for session {session_id}: {e}")
+            yield f"event: error\ndata: {json.dumps({'error': 'Failed to generate report'})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/report_pdf/{session_id}")
+async def get_report_pdf(session_id: str):
+    """
+    The PDF of the session's latest report. The PDF cache is per worker, so a
+    worker that didn't generate the report re-renders it from the report text
+    stored on the session.
+    """
+    pdf_bytes = pdf_cache.latest(session_id)
+    if pdf_bytes is None:
+        session = await session_store.get(session_id)
+        if session is None or not session.get("report"):
+            raise HTTPException(status_code=404, detail="Report not found")
+        pdf_bytes = await render_report_pdf(session_id, session["report"])
+    return pdf_response(pdf_bytes)
+
+
+
+BATCH_OUTPUT_DIR = os.getenv("BATCH_OUTPUT_DIR", "batch_results")
+
+# job_id -> {"runner": BatchRunner, "task": asyncio.Task}. Jobs run on the worker
+# that accepted them; other workers can only report progress from the results file.
+batch_jobs = {}
+
+
+class BatchRequest(BaseModel):
+    records: List[Dict[str, Union[str, int, None]]]
+    pdf: bool = False
+    concurrency: int = Field(8, ge=1, le=BATCH_MAX_CONCURRENCY)
+
+
+def _batch_paths(job_id):
+    if not job_id.isalnum():
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return (os.path.join(BATCH_OUTPUT_DIR, f"{job_id}.input.jsonl"),
+            os.path.join(BATCH_OUTPUT_DIR, f"{job_id}.jsonl"),
+            os.path.join(BATCH_OUTPUT_DIR, job_id))
+
+
+def _start_batch_job(job_id, pdf, concurrency):
+    input_path, output_path, pdf_dir = _batch_paths(job_id)
+    runner = BatchRunner(output_path, pdf_dir if pdf else None, concurrency)
+    task = asyncio.create_task(runner.run(read_records(input_path)))
+    batch_jobs[job_id] = {"runner": runner, "task": task, "pdf": pdf, "concurrency": concurrency}
+
+
+def _count_results(output_path):
+    counts = {"ok": 0, "failed": 0}
+    if os.path.exists(output_path):
+        with open(output_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    ok = json.loads(line).get("status") == "ok"
+                except ValueError:
+                    continue
+                counts["ok" if ok else "failed"] += 1
+    return counts
+
+
+@app.post("/batch")
+async def submit_batch(batch: BatchRequest):
+    """
+    Starts an offline batch over the posted intake records (each with a
+    `symptoms` text) and returns a job id to poll. Results accumulate as JSONL
+    at /batch/{job_id}/results.
+    """
+    os.makedirs(BATCH_OUTPUT_DIR, exist_ok=True)
+    job_id = uuid.uuid4().hex
+    input_path, _, _ = _batch_paths(job_id)
+    # The input is kept on disk so an interrupted job can be resumed
+    with open(input_path, "w", encoding="utf-8") as f:
+        for record in batch.records:
+            f.write(json.dumps(record) + "\n")
+    _start_batch_job(job_id, batch.pdf, batch.concurrency)
+    return {"job_id": job_id, "status_url": f"/batch/{job_id}", "results_url": f"/batch/{job_id}/results"}
+
+
+@app.post("/batch/{job_id}/resume")
+async def resume_batch(job_id: str, pdf: bool = False,
+                       concurrency: int = Query(8, ge=1, le=BATCH_MAX_CONCURRENCY)):
+    """Restarts a job (e.g. after a worker restart), skipping records already done."""
+    job = batch_jobs.get(job_id)
+    if job is not None and not job["task"].done():
+        raise HTTPException(status_code=409, detail="Batch job is still running")
+    if not os.path.exists(_batch_paths(job_id)[0]):
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    _start_batch_job(job_id, pdf, concurrency)
+    return {"job_id": job_id, "status_url": f"/batch/{job_id}"}
+
+
+@app.get("/batch/{job_id}")
+async def get_batch_status(job_id: str):
+    job = batch_jobs.get(job_id)
+    if job is None:
+        input_path, output_path, _ = _batch_paths(job_id)
+        if not os.path.exists(input_path):
+            raise HTTPException(status_code=404, detail="Batch job not found")
+        # Started by another worker (or before a restart): count what it has written so far
+        counts = await asyncio.to_thread(_count_results, output_path)
+        return {**counts, "running": None, "output_path": output_path,
+                "detail": "Job is not running on this worker; progress is read from its results file"}
+    status = job["runner"].stats()
+    if job["task"].done() and job["task"].exception() is not None:
+        status["error"] = str(job["task"].exception())
+    return status
+
+
+@app.get("/batch/{job_id}/results")
+async def get_batch_results(job_id: str):
+    """
+    The job's results so far. A running job keeps appending to the file, so
+    only the bytes present when the request came in are sent, matching the
+    declared Content-Length.
+    """
+    output_path = _batch_paths(job_id)[1]
+    try:
+        size = os.stat(output_path).st_size
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="No results yet")
+
+    def chunks():
+        with open(output_path, "rb") as f:
+            remaining = size
+            while remaining > 0:
+                data = f.read(min(PDF_CHUNK_SIZE, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+
+    return StreamingResponse(chunks(), media_type="application/x-ndjson",
+                             headers={"Content-Length": str(size)})
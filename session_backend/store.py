@@ -0,0 +1,159 @@
+import json
+import os
+import time
+from collections import OrderedDict
+
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(6 * 3600)))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+
+
+class SessionStore:
+    """
+    Interface for consultation session storage. Sessions are plain JSON-able
+    dicts; callers must `save` a session after mutating it, because backends
+    other than the in-memory one hand out copies.
+
+    `save` writes every field of the caller's copy. Work that finishes in the
+    background, or on another worker, should write only the fields it owns
+    with `update`, so it can't put back stale values of the other fields.
+    """
+
+    async def get(self, session_id):
+        raise NotImplementedError
+
+    async def save(self, session_id, session):
+        raise NotImplementedError
+
+    async def update(self, session_id, fields):
+        """Sets the given top-level fields of an existing session, leaving the others alone."""
+        raise NotImplementedError
+
+    async def delete(self, session_id):
+        raise NotImplementedError
+
+    async def ping(self):
+        """Returns True when the backend is reachable; used by the readiness probe."""
+        return True
+
+    def stats(self):
+        return {}
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    Process-local store with a size cap (least recently used sessions are
+    evicted first) and a sliding TTL refreshed on every read and write.
+    """
+
+    def __init__(self, max_entries=SESSION_MAX_ENTRIES, ttl_seconds=SESSION_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict()  # session_id -> (session, expires_at)
+        self.counters = {"evicted": 0, "expired": 0}
+
+    async def get(self, session_id):
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        session, expires_at = entry
+        now = time.time()
+        if expires_at <= now:
+            del self._sessions[session_id]
+            self.counters["expired"] += 1
+            return None
+        self._sessions[session_id] = (session, now + self.ttl_seconds)
+        self._sessions.move_to_end(session_id)
+        return session
+
+    async def save(self, session_id, session):
+        self._sessions[session_id] = (session, time.time() + self.ttl_seconds)
+        self._sessions.move_to_end(session_id)
+        self._evict()
+
+    async def update(self, session_id, fields):
+        session = await self.get(session_id)
+        if session is not None:
+            session.update(fields)
+
+    async def delete(self, session_id):
+        self._sessions.pop(session_id, None)
+
+    def _evict(self):
+        now = time.time()
+        # Oldest entries sit at the front, so expired ones are found first
+        while self._sessions:
+            session_id, (_, expires_at) = next(iter(self._sessions.items()))
+            if expires_at > now and len(self._sessions) <= self.max_entries:
+                break
+            self._sessions.popitem(last=False)
+            self.counters["expired" if expires_at <= now else "evicted"] += 1
+
+    def stats(self):
+        return {"backend": "memory", "sessions": len(self._sessions), "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds, **self.counters}
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Stores each session as a Redis hash under `prefix + session_id`, one
+    JSON-encoded hash field per session field, with a TTL, so any uvicorn
+    worker on any node can serve any session. Writes only touch the fields
+    they carry: an `update` of the report is not undone by another worker
+    saving its older copy of the session. `client` is a redis.asyncio client
+    or anything speaking the same API (e.g. fakeredis).
+    """
+
+    def __init__(self, client, ttl_seconds=SESSION_TTL_SECONDS, prefix="session:h:"):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    async def get(self, session_id):
+        key = self.prefix + session_id
+        raw = await self.client.hgetall(key)
+        if not raw:
+            return None
+        await self.client.expire(key, self.ttl_seconds)
+        return {_text(name): json.loads(value) for name, value in raw.items()}
+
+    async def _write(self, key, fields):
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping={name: json.dumps(value) for name, value in fields.items()})
+            pipe.expire(key, self.ttl_seconds)
+            await pipe.execute()
+
+    async def save(self, session_id, session):
+        await self._write(self.prefix + session_id, session)
+
+    async def update(self, session_id, fields):
+        key = self.prefix + session_id
+        # Don't bring an expired or deleted session back as a few loose fields
+        if fields and await self.client.exists(key):
+            await self._write(key, fields)
+
+    async def delete(self, session_id):
+        await self.client.delete(self.prefix + session_id)
+
+    async def ping(self):
+        return bool(await self.client.ping())
+
+    def stats(self):
+        return {"backend": "redis", "ttl_seconds": self.ttl_seconds, "prefix": self.prefix}
+
+
+def _text(name):
+    return name.decode("utf-8") if isinstance(name, bytes) else name
+
+
+def create_session_store(backend=SESSION_BACKEND):
+    """Builds the store selected by SESSION_BACKEND ("memory" or "redis")."""
+    if backend == "redis":
+        import redis.asyncio as redis
+
+        return RedisSessionStore(redis.from_url(REDIS_URL))
+    if backend == "memory":
+        return InMemorySessionStore()
+    raise ValueError(f"Unknown session backend: {backend}")
@@ -0,0 +1,281 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+from helper_functions.metrics import registry
+from symptom_processing.normalization import QUALIFIER_WORDS, normalize_text, symptom_index
+
+
+DISEASE_PROFILES_PATH = os.getenv(
+    "DISEASE_PROFILES_PATH", os.path.join(os.path.dirname(__file__), "disease_profiles.json")
+)
+# Where the built matrix is kept as .npy files and memory-mapped from, one
+# subdirectory per version of the profiles file; shared by the workers of a host
+DISEASE_INDEX_DIR = os.getenv("DISEASE_INDEX_DIR", os.path.join(tempfile.gettempdir(), "disease_index_cache"))
+DISEASE_INDEX_TOP_K = int(os.getenv("DISEASE_INDEX_TOP_K", "5"))
+# Symptoms confirmed in follow-up answers count for less than the intake symptoms
+ANSWER_SYMPTOM_WEIGHT = float(os.getenv("ANSWER_SYMPTOM_WEIGHT", "0.5"))
+# Longest symptom name, in words, looked for inside a follow-up answer
+MAX_SYMPTOM_WORDS = 4
+
+ARRAYS = ("symptom_indptr", "symptom_diseases", "symptom_weights", "disease_indptr", "disease_symptoms")
+
+disease_index_queries = registry.counter(
+    "disease_index_queries_total", "Preliminary differentials ranked by the local disease index"
+)
+
+
+def build_arrays(profiles):
+    """
+    Turns {disease: {"symptoms": {symptom: weight}, "urgency": ...}} into a
+    sparse symptom x disease matrix. Each disease's weights are L2-normalized,
+    so a dot product with a normalized query is a cosine similarity.
+
+    Returns (arrays, meta): the matrix in compressed sparse column form (one
+    posting list of diseases per symptom) plus each disease's symptom ids in
+    compressed sparse row form, and the names needed to read them.
+    """
+    diseases = sorted(profiles)
+    symptom_ids = {}
+    rows = []
+    for disease in diseases:
+        weights = {}
+        for symptom, weight in profiles[disease]["symptoms"].items():
+            sid = symptom_ids.setdefault(normalize_text(symptom), len(symptom_ids))
+            weights[sid] = max(weights.get(sid, 0.0), float(weight))
+        rows.append(weights)
+
+    postings = [[] for _ in symptom_ids]
+    disease_indptr = [0]
+    disease_symptoms = []
+    for did, weights in enumerate(rows):
+        norm = sum(w * w for w in weights.values()) ** 0.5 or 1.0
+        for sid in sorted(weights):
+            postings[sid].append((did, weights[sid] / norm))
+            disease_symptoms.append(sid)
+        disease_indptr.append(len(disease_symptoms))
+
+    symptom_indptr = np.zeros(len(postings) + 1, dtype=np.int64)
+    symptom_indptr[1:] = np.cumsum([len(p) for p in postings])
+    arrays = {
+        "symptom_indptr": symptom_indptr,
+        "symptom_diseases": np.array([d for p in postings for d, _ in p], dtype=np.int32),
+        "symptom_weights": np.array([w for p in postings for _, w in p], dtype=np.float32),
+        "disease_indptr": np.array(disease_indptr, dtype=np.int64),
+        "disease_symptoms": np.array(disease_symptoms, dtype=np.int32),
+    }
+    meta = {
+        "diseases": diseases,
+        "urgency": [profiles[d].get("urgency") for d in diseases],
+        "symptoms": sorted(symptom_ids, key=symptom_ids.get),
+    }
+    return arrays, meta
+
+
+class DiseaseIndex:
+    """
+    Local symptom x disease matrix for an instant preliminary differential.
+
+    The matrix is built from a profiles file once, saved as .npy files in a
+    subdirectory of `cache_dir` named after the file's hash, and memory-mapped
+    from there, so the operating system shares the pages between workers and a
+    restart doesn't rebuild it. A changed profiles file gets a new
+    subdirectory. With no profiles file, `cache_dir` itself holds the index.
+
+    `rank` scores a session's symptoms against every disease in one bincount
+    over the posting lists of the matched symptoms; no LLM is involved.
+    """
+
+    def __init__(self, profiles_path=DISEASE_PROFILES_PATH, cache_dir=DISEASE_INDEX_DIR):
+        self.profiles_path = profiles_path
+        self.cache_dir = cache_dir
+        self.loaded = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def save(profiles, index_dir, source_hash=None):
+        """
+        Builds the index into a temporary directory next to `index_dir` and
+        renames it into place, so no reader ever sees a half-written index.
+        When another worker has put its copy there first, that one is kept.
+        """
+        arrays, meta = build_arrays(profiles)
+        meta["source_hash"] = source_hash
+        parent = os.path.dirname(os.path.abspath(index_dir))
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=".building-", dir=parent)
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+            with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            try:
+                os.replace(tmp_dir, index_dir)
+            except OSError:
+                if not os.path.exists(os.path.join(index_dir, "meta.json")):
+                    raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return meta
+
+    def _source_hash(self):
+        with open(self.profiles_path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    @staticmethod
+    def _read_meta(index_dir):
+        try:
+            with open(os.path.join(index_dir, "meta.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _remove_other_versions(self, keep):
+        # Workers still mapping an old version keep their pages until they restart
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name != keep and not name.startswith(".") and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def load(self):
+        """Memory-maps the index, building it first if this profiles file has none yet."""
+        with self._lock:
+            if self.loaded:
+                return
+            if self.profiles_path is None:
+                index_dir = self.cache_dir
+                meta = self._read_meta(index_dir)
+            else:
+                source_hash = self._source_hash()
+                index_dir = os.path.join(self.cache_dir, source_hash[:16])
+                meta = self._read_meta(index_dir)
+                if meta is None:
+                    with open(self.profiles_path, encoding="utf-8") as f:
+                        profiles = json.load(f)
+                    meta = self.save(profiles, index_dir, source_hash)
+                    self._remove_other_versions(keep=source_hash[:16])
+                    print(f"Built disease index: {len(meta['diseases'])} diseases, {len(meta['symptoms'])} symptoms")
+            for name in ARRAYS:
+                setattr(self, name, np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r"))
+            self.diseases = meta["diseases"]
+            self.urgency = meta["urgency"]
+            self.symptoms = meta["symptoms"]
+            self.symptom_ids = {name: sid for sid, name in enumerate(self.symptoms)}
+            self.index_dir = index_dir
+            self.loaded = True
+
+    def _symptom_id(self, term):
+        text = normalize_text(term)
+        sid = self.symptom_ids.get(text)
+        if sid is None:
+            canonical = symptom_index.lookup(text)
+            sid = self.symptom_ids.get(canonical) if canonical else None
+        return sid
+
+    def _mentioned_ids(self, text):
+        """
+        Ids of the symptoms a follow-up answer or question names word for word
+        or by synonym, without fuzzy matching. Text with a negation or
+        qualifier ("No fever", "Cough with blood") names none.
+        """
+        words = normalize_text(text).split()
+        if not QUALIFIER_WORDS.isdisjoint(words):
+            return []
+        ids = []
+        for size in range(1, MAX_SYMPTOM_WORDS + 1):
+            for start in range(len(words) - size + 1):
+                phrase = " ".join(words[start:start + size])
+                sid = self.symptom_ids.get(phrase)
+                if sid is None:
+                    canonical = symptom_index.exact_lookup(phrase)
+                    sid = self.symptom_ids.get(canonical) if canonical else None
+                if sid is not None:
+                    ids.append(sid)
+        return ids
+
+    def query_weights(self, symptoms, chat_history=None):
+        """
+        Symptom id -> weight for a session. Intake symptoms weigh 1; a symptom
+        named in a follow-up answer, or in the question a "yes" answered,
+        weighs ANSWER_SYMPTOM_WEIGHT. Negated answers add nothing.
+        """
+        weights = {}
+        for term in symptoms:
+            sid = self._symptom_id(term)
+            if sid is not None:
+                weights[sid] = 1.0
+        question = None
+        for turn in chat_history or []:
+            if "bot" in turn:
+                question = turn["bot"]
+                continue
+            answer = str(turn.get("user", ""))
+            mentioned = self._mentioned_ids(answer)
+            if question and normalize_text(answer).split()[:1] == ["yes"]:
+                mentioned += self._mentioned_ids(question)
+            for sid in mentioned:
+                weights.setdefault(sid, ANSWER_SYMPTOM_WEIGHT)
+        return weights
+
+    def scores(self, weights):
+        """Cosine similarity of the weighted query against every disease."""
+        if not weights:
+            return np.zeros(len(self.diseases), dtype=np.float32)
+        sids = np.fromiter(weights, dtype=np.int64)
+        query = np.fromiter(weights.values(), dtype=np.float32)
+        starts, ends = self.symptom_indptr[sids], self.symptom_indptr[sids + 1]
+        lengths = ends - starts
+        # Gather the matched symptoms' posting lists and sum them per disease
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        contributions = self.symptom_weights[positions] * np.repeat(query, lengths)
+        totals = np.bincount(self.symptom_diseases[positions], weights=contributions,
+                             minlength=len(self.diseases))
+        return totals / float(np.linalg.norm(query))
+
+    def rank(self, symptoms, chat_history=None, top_k=DISEASE_INDEX_TOP_K):
+        """
+        Returns the `top_k` best-matching diseases as
+        [{"disease", "score", "urgency", "matched"}], best first; diseases
+        sharing no symptom with the session are left out.
+        """
+        self.load()
+        disease_index_queries.inc()
+        weights = self.query_weights(symptoms, chat_history)
+        scores = self.scores(weights)
+        k = min(top_k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        shortlist = []
+        for did in top:
+            score = float(scores[did])
+            if score <= 0:
+                break
+            row = self.disease_symptoms[self.disease_indptr[did]:self.disease_indptr[did + 1]]
+            shortlist.append({
+                "disease": self.diseases[did],
+                "score": round(score, 3),
+                "urgency": self.urgency[did],
+                "matched": [self.symptoms[sid] for sid in row if int(sid) in weights],
+            })
+        return shortlist
+
+    def stats(self):
+        if not self.loaded:
+            return {"loaded": False}
+        return {
+            "loaded": True,
+            "diseases": len(self.diseases),
+            "symptoms": len(self.symptoms),
+            "nonzeros": int(self.symptom_diseases.shape[0]),
+            "index_dir": self.index_dir,
+        }
+
+
+disease_index = DiseaseIndex()
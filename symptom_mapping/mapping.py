@@ -1,17 +1,30 @@
-import os
-from dotenv import load_dotenv
-load_dotenv()
-import google.generativeai as genai
+import asyncio
+import hashlib
+import json
 
-#temprorary model for testing
-google_api_key = os.getenv("GOOGLE_API_KEY")
-genai.configure(api_key=google_api_key)
-model = genai.GenerativeModel("gemini-2.0-flash")
+from helper_functions.metrics import timed
+from llm_gateway.admission import llm_priority, PRIORITY_REPORT
+from llm_gateway.gateway import generate_content_async
+from symptom_mapping.disease_index import disease_index
 
 
 
-def generate_llm_prompt(age,gender,symptoms, chat_history):
+def format_candidates(candidates):
+    return "\n".join(
+        f"        - {c['disease']} (matches: {', '.join(c['matched'])}; typical urgency: {c['urgency']})"
+        for c in candidates
+    )
+
+
+def generate_llm_prompt(age,gender,symptoms, chat_history, candidates=None):
     formatted_symptoms = ", ".join(symptoms)
+    shortlist = ""
+    if candidates:
+        shortlist = f"""
+        A symptom-matching index suggests these candidates, best match first:
+{format_candidates(candidates)}
+        Prefer conditions from this list when they fit, but replace any that the chat history rules out.
+"""
 
     return f"""
         You are a highly experienced medical diagnosis doctor.
@@ -24,7 +37,7 @@ def generate_llm_prompt(age,gender,symptoms, chat_history):
 
         Chat History:
         {chat_history}
-
+        {shortlist}
         Based on all the above, list the top 3 most likely medical conditions or diseases this patient may have. For each, provide:
         - Condition name
         - One-line reasoning (based on symptoms + answers)
@@ -35,7 +48,94 @@ def generate_llm_prompt(age,gender,symptoms, chat_history):
 
 
 
-def get_disease_symptom_mapping(age,gender,symptoms, chat_history):
-    prompt = generate_llm_prompt(age,gender,symptoms, chat_history)
-    response = model.generate_content(prompt)
-    return response.text
\ No newline at end of file
+def preliminary_differential(symptoms, chat_history=None):
+    """Ranked candidate diseases from the local index; [] if it can't be used."""
+    try:
+        return disease_index.rank(symptoms, chat_history)
+    except Exception as e:
+        print(f"Disease index lookup failed: {e}")
+        return []
+
+
+@timed("get_disease_symptom_mapping")
+async def get_disease_symptom_mapping(age,gender,symptoms, chat_history):
+    candidates = preliminary_differential(symptoms, chat_history)
+    prompt = generate_llm_prompt(age,gender,symptoms, chat_history, candidates)
+    return await generate_content_async(prompt, call_type="mapping")
+
+
+# session_id -> (history fingerprint, task) for mappings still running before /generate_report
+mapping_jobs = {}
+
+
+def history_fingerprint(symptoms, chat_history):
+    payload = json.dumps({"symptoms": symptoms, "chat_history": chat_history}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def start_speculative_mapping(session_id, session, update=None):
+    """
+    Starts the disease mapping in the background as soon as the follow-up is
+    finished, so /generate_report can reuse it instead of waiting on the LLM.
+    The result is stored on the session along with the history it was built
+    from, and persisted with `update(session_id, fields)` when given: only
+    that field is written, since the session may have moved on meanwhile.
+    """
+    age, gender, symptoms = session["age"], session["gender"], session["symptoms"]
+    chat_history = list(session["chat_history"])
+    fingerprint = history_fingerprint(symptoms, chat_history)
+
+    existing = mapping_jobs.get(session_id)
+    if existing and existing[0] == fingerprint:
+        return existing[1]
+
+    async def run():
+        # Started from the websocket, but it is report work
+        llm_priority.set(PRIORITY_REPORT)
+        try:
+            mapped = await get_disease_symptom_mapping(age, gender, symptoms, chat_history)
+        except Exception as e:
+            print(f"Speculative mapping failed for session {session_id}: {e}")
+            return None
+        session["mapped_diseases"] = {"fingerprint": fingerprint, "value": mapped}
+        if update is not None:
+            await update(session_id, {"mapped_diseases": session["mapped_diseases"]})
+        return mapped
+
+    def forget(done):
+        # The result (if any) is on the session by now; keeping the task would leak one
+        # entry per session that never asks for a report
+        if mapping_jobs.get(session_id, (None, None))[1] is done:
+            del mapping_jobs[session_id]
+
+    task = asyncio.create_task(run())
+    mapping_jobs[session_id] = (fingerprint, task)
+    task.add_done_callback(forget)
+    return task
+
+
+async def get_session_mapping(session_id, session, update=None):
+    """
+    Returns the disease mapping for the session's current history, reusing a
+    finished or in-flight speculative job when it was built from the same
+    history, and calling the LLM otherwise.
+    """
+    age, gender, symptoms = session["age"], session["gender"], session["symptoms"]
+    chat_history = session["chat_history"]
+    fingerprint = history_fingerprint(symptoms, chat_history)
+
+    stored = session.get("mapped_diseases")
+    if stored and stored["fingerprint"] == fingerprint:
+        return stored["value"]
+
+    job = mapping_jobs.pop(session_id, None)
+    if job and job[0] == fingerprint:
+        mapped = await job[1]
+        if mapped is not None:
+            return mapped
+
+    mapped = await get_disease_symptom_mapping(age, gender, symptoms, chat_history)
+    session["mapped_diseases"] = {"fingerprint": fingerprint, "value": mapped}
+    if update is not None:
+        await update(session_id, {"mapped_diseases": session["mapped_diseases"]})
+    return mapped
@@ -0,0 +1,160 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from helper_functions.metrics import timed
+from symptom_processing.nlp_model import get_nlp, warm_up
+
+
+EXTRACTION_BATCH_SIZE = int(os.getenv("EXTRACTION_BATCH_SIZE", "16"))
+EXTRACTION_MAX_WAIT_MS = float(os.getenv("EXTRACTION_MAX_WAIT_MS", "10"))
+# 0 runs NER in a thread instead of a process pool (useful on single-core boxes)
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+
+
+def _extract_batch(texts):
+    # Runs inside a worker process: the pipeline is loaded once per worker
+    nlp = get_nlp()
+    results = []
+    for doc in nlp.pipe(texts, batch_size=len(texts)):
+        results.append(list({ent.text.lower() for ent in doc.ents}))
+    return results
+
+
+def _warm_worker():
+    return {"pid": os.getpid(), **warm_up()}
+
+
+class EntityExtractionService:
+    """
+    Collects concurrent symptom texts into micro-batches and runs them through
+    `nlp.pipe` in a process pool, so CPU-bound NER never runs on the event loop.
+
+    A batch is flushed when it reaches `batch_size` texts or when the first
+    text in it has waited `max_wait_ms`, whichever comes first.
+    """
+
+    def __init__(self, batch_size=EXTRACTION_BATCH_SIZE, max_wait_ms=EXTRACTION_MAX_WAIT_MS,
+                 workers=EXTRACTION_WORKERS):
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.workers = workers
+        self._queue = None
+        self._pool = None
+        self._runner = None
+        self._inflight = set()
+        self.worker_stats = []
+        self.warmed = False
+        self.batches = 0
+        self.texts = 0
+
+    async def start(self, warm=True):
+        if self._runner is not None:
+            return
+        if self.workers > 0:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        self._queue = asyncio.Queue()
+        self._runner = asyncio.create_task(self._run())
+
+        if warm:
+            await self.warm()
+
+    async def warm(self):
+        """Loads scispaCy in every worker; `warmed` is set once they are all ready."""
+        loop = asyncio.get_running_loop()
+        warmups = [loop.run_in_executor(self._pool, _warm_worker) for _ in range(max(1, self.workers))]
+        self.worker_stats = await asyncio.gather(*warmups)
+        self.warmed = True
+
+    async def stop(self):
+        if self._runner is None:
+            return
+        self._runner.cancel()
+        try:
+            await self._runner
+        except asyncio.CancelledError:
+            pass
+        self._runner = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    @timed("extract_medical_terms")
+    async def extract(self, text):
+        """Returns the lower-cased, de-duplicated entity texts found in `text`."""
+        if self._runner is None:
+            await self.start(warm=False)
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def extract_many(self, texts):
+        """
+        Runs one `nlp.pipe` pass over `texts` in the pool, bypassing the
+        micro-batcher; for callers such as batch jobs that already have a batch.
+        """
+        if self._runner is None:
+            await self.start(warm=False)
+        results = await asyncio.get_running_loop().run_in_executor(self._pool, _extract_batch, list(texts))
+        self.batches += 1
+        self.texts += len(texts)
+        return results
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Don't wait for this batch before collecting the next one; the pool
+            # is sized to the cores so several batches can run side by side
+            task = asyncio.create_task(self._process(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _process(self, batch):
+        texts = [text for text, _ in batch]
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self._pool, _extract_batch, texts)
+        except Exception as e:
+            print(f"Error running entity extraction batch: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.texts += len(texts)
+        for (_, future), terms in zip(batch, results):
+            if not future.done():
+                future.set_result(terms)
+
+    def stats(self):
+        return {
+            "batch_size": self.batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "workers": self.workers,
+            "warmed": self.warmed,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "texts": self.texts,
+            "avg_batch_size": round(self.texts / self.batches, 2) if self.batches else 0.0,
+            "worker_models": self.worker_stats,
+        }
+
+
+extraction_service = EntityExtractionService()
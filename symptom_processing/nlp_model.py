@@ -0,0 +1,78 @@
+import os
+import resource
+import threading
+import time
+
+
+SCISPACY_MODEL = os.getenv("SCISPACY_MODEL", "en_core_sci_sm")
+
+# en_core_sci_sm ships tok2vec, tagger, attribute_ruler, lemmatizer, parser and ner.
+# Entity extraction only needs tok2vec + ner, so the rest are never deserialized.
+NER_EXCLUDED_COMPONENTS = ["tagger", "attribute_ruler", "lemmatizer", "parser"]
+
+
+_models = {}
+_stats = {}
+_lock = threading.Lock()
+
+
+def _rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def get_nlp(name=SCISPACY_MODEL):
+    """
+    Returns the shared spaCy pipeline for `name`, loading it on first use.
+    The pipeline is loaded once per process and reused by every request.
+    """
+    nlp = _models.get(name)
+    if nlp is not None:
+        return nlp
+
+    with _lock:
+        if name in _models:
+            return _models[name]
+
+        # Imported here rather than at module level: spaCy alone takes seconds to
+        # import, and only the NER worker processes ever need it
+        import spacy
+
+        rss_before = _rss_mb()
+        start = time.perf_counter()
+        nlp = spacy.load(name, exclude=NER_EXCLUDED_COMPONENTS)
+        load_seconds = time.perf_counter() - start
+
+        _models[name] = nlp
+        _stats[name] = {
+            "model": name,
+            "pipeline": list(nlp.pipe_names),
+            "load_seconds": round(load_seconds, 3),
+            "memory_mb": round(max(_rss_mb() - rss_before, 0.0), 1),
+        }
+        print(f"Loaded spaCy model {name} in {load_seconds:.2f}s")
+        return nlp
+
+
+def warm_up(name=SCISPACY_MODEL):
+    """
+    Loads the pipeline and runs one tiny document through it so the first real
+    request does not pay for lazy initialisation. Safe to call at app startup.
+    """
+    nlp = get_nlp(name)
+    nlp("Patient reports mild headache and fever.")
+    return model_stats(name)
+
+
+def is_loaded(name=SCISPACY_MODEL):
+    return name in _models
+
+
+def model_stats(name=None):
+    """
+    Returns load time (seconds) and approximate memory footprint (MB of peak RSS
+    growth during load) for one loaded model, or for all of them if `name` is None.
+    """
+    if name is not None:
+        return _stats.get(name)
+    return dict(_stats)
@@ -0,0 +1,157 @@
+import heapq
+import json
+import os
+import re
+from collections import OrderedDict
+
+
+SYMPTOM_SYNONYMS_PATH = os.getenv(
+    "SYMPTOM_SYNONYMS_PATH", os.path.join(os.path.dirname(__file__), "symptom_synonyms.json")
+)
+# Minimum trigram Dice similarity for a fuzzy match to be accepted
+FUZZY_MATCH_THRESHOLD = float(os.getenv("FUZZY_MATCH_THRESHOLD", "0.7"))
+FUZZY_CACHE_SIZE = 4096
+# How many top-ranked candidates get a full similarity check
+FUZZY_CANDIDATES = 32
+
+_non_alnum = re.compile(r"[^a-z0-9]+")
+
+# Words that change a term's clinical meaning ("no fever", "coughing blood",
+# "left arm weakness"). Terms containing one are never mapped onto a plain
+# canonical symptom; they are kept as written.
+QUALIFIER_WORDS = frozenset({
+    "no", "not", "without", "denies", "denied", "never", "negative", "normal",
+    "blood", "bloody", "left", "right",
+})
+
+
+def normalize_text(text):
+    return _non_alnum.sub(" ", str(text).lower()).strip()
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SymptomIndex:
+    """
+    In-memory index of canonical symptoms and their synonyms.
+
+    Exact and synonym lookups (also ignoring spacing, so "head ache" finds
+    "headache") are single dict hits. Anything else goes through a trigram
+    inverted index and is accepted when its Dice similarity to a known name
+    reaches `threshold`. A term is not mapped merely because it contains a
+    known name ("coughing blood" is not "cough"), and terms with negation or
+    qualifier words are never mapped. Unknown terms are kept, just normalized.
+    """
+
+    def __init__(self, synonyms, threshold=FUZZY_MATCH_THRESHOLD):
+        self.threshold = threshold
+        self._exact = {}
+        self._squashed = {}
+        self._names = []  # every indexed surface form
+        self._canonical_of = []  # canonical symptom of each surface form
+        self._trigram_counts = []
+        self._postings = {}
+        self._fuzzy_cache = OrderedDict()
+
+        for canonical, variants in synonyms.items():
+            canonical_norm = normalize_text(canonical)
+            for name in [canonical, *variants]:
+                self._add(normalize_text(name), canonical_norm)
+
+    @classmethod
+    def from_file(cls, path=SYMPTOM_SYNONYMS_PATH, **kwargs):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f), **kwargs)
+
+    def _add(self, name, canonical):
+        if not name or name in self._exact:
+            return
+        self._exact[name] = canonical
+        self._squashed.setdefault(name.replace(" ", ""), canonical)
+        entry = len(self._names)
+        self._names.append(name)
+        self._canonical_of.append(canonical)
+        grams = trigrams(name)
+        self._trigram_counts.append(len(grams))
+        for gram in grams:
+            self._postings.setdefault(gram, []).append(entry)
+
+    def __len__(self):
+        return len(self._names)
+
+    def lookup(self, term):
+        """
+        Returns the canonical symptom for `term`, or None if nothing is close
+        enough. Exact names and synonyms match directly, and near misses
+        (typos) through the trigram index.
+        """
+        text = normalize_text(term)
+        if not text or not QUALIFIER_WORDS.isdisjoint(text.split()):
+            return None
+        return self._exact_match(text) or self._fuzzy(text)
+
+    def exact_lookup(self, term):
+        """Like lookup, but only for exact names and synonyms; no fuzzy matching."""
+        text = normalize_text(term)
+        if not text or not QUALIFIER_WORDS.isdisjoint(text.split()):
+            return None
+        return self._exact_match(text)
+
+    def _exact_match(self, text):
+        return self._exact.get(text) or self._squashed.get(text.replace(" ", ""))
+
+    def _fuzzy(self, text):
+        if text in self._fuzzy_cache:
+            self._fuzzy_cache.move_to_end(text)
+            return self._fuzzy_cache[text]
+
+        grams = trigrams(text)
+        size = len(grams)
+        # Candidates are ranked by how many *selective* trigrams they share with
+        # the query: very common ones ("pai", "in ") would drag in a large part of
+        # the vocabulary. Only the best few are then scored on all their trigrams.
+        max_postings = max(256, len(self._names) // 200)
+        shared = {}
+        for gram in grams:
+            postings = self._postings.get(gram, ())
+            if len(postings) <= max_postings:
+                for entry in postings:
+                    shared[entry] = shared.get(entry, 0) + 1
+
+        t = self.threshold
+        shortest, longest = t * size / (2 - t), size * (2 - t) / t
+        best, best_score = None, t
+        for entry in heapq.nlargest(FUZZY_CANDIDATES, shared, key=shared.get):
+            count = self._trigram_counts[entry]
+            if count < shortest or count > longest:
+                continue
+            score = 2 * len(grams & trigrams(self._names[entry])) / (size + count)
+            if score >= best_score:
+                best, best_score = self._canonical_of[entry], score
+
+        self._fuzzy_cache[text] = best
+        if len(self._fuzzy_cache) > FUZZY_CACHE_SIZE:
+            self._fuzzy_cache.popitem(last=False)
+        return best
+
+    def normalize_terms(self, terms):
+        """
+        Maps extracted terms to canonical symptoms, keeping unknown terms in
+        normalized form, and returns them de-duplicated in a stable sorted order.
+        """
+        result = set()
+        for term in terms:
+            canonical = self.lookup(term)
+            if canonical is not None:
+                result.add(canonical)
+            else:
+                text = normalize_text(term)
+                if text:
+                    result.add(text)
+        return sorted(result)
+
+
+symptom_index = SymptomIndex.from_file()
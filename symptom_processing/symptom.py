@@ -1,41 +1,71 @@
-import spacy
-import scispacy
-from spacy import displacy
+import asyncio
 import os
-from dotenv import load_dotenv
-load_dotenv()
-import google.generativeai as genai
+from typing import List
 
-#temprorary model for testing
-google_api_key = os.getenv("GOOGLE_API_KEY")
-genai.configure(api_key=google_api_key)
-model = genai.GenerativeModel("gemini-2.0-flash")
+from pydantic import BaseModel
 
+from helper_functions.metrics import timed
+from llm_gateway.admission import AdmissionRejected
+from llm_gateway.structured import generate_structured_async
+from symptom_processing.extraction_service import extraction_service
+from symptom_processing.normalization import symptom_index
 
-def extract_medical_terms(text):
-    nlp = spacy.load("en_core_sci_sm")
-    doc = nlp(text)
-    medical_entities = [ent.text.lower() for ent in doc.ents]
-    return list(set(medical_entities))  
+NER_TIMEOUT_SECONDS = float(os.getenv("NER_TIMEOUT_SECONDS", "5"))
+LLM_EXTRACTION_TIMEOUT_SECONDS = float(os.getenv("LLM_EXTRACTION_TIMEOUT_SECONDS", "4"))
 
 
-def clarify_symptoms(text):
-    prompt = f"""You are a medical expert. Extract only medical symptoms from this sentence:
+class SymptomList(BaseModel):
+    symptoms: List[str] = []
+
+
+def clarify_symptoms_prompt(text):
+    return f"""You are a medical expert. Extract only medical symptoms from this sentence:
     "{text}".
-    Just return a list of symptoms like ['headache', 'fever']
+    Just return JSON like {{"symptoms": ["headache", "fever"]}}
+    """
+
+
+@timed("clarify_symptoms")
+async def clarify_symptoms_async(text):
+    result = await generate_structured_async(
+        clarify_symptoms_prompt(text), SymptomList, call_type="symptom_extraction", list_field="symptoms"
+    )
+    return result.symptoms
+
+
+async def hybrid_symptom_extraction_async(text, ner_timeout=NER_TIMEOUT_SECONDS,
+                                          llm_timeout=LLM_EXTRACTION_TIMEOUT_SECONDS, sci_terms=None,
+                                          fallback_on_rejection=True):
+    """
+    Runs spaCy NER and the LLM symptom extraction at the same time and merges
+    both once they finish. Each branch has its own timeout; a slow or failing
+    branch contributes no terms instead of stalling the request, so a slow LLM
+    falls back to the spaCy terms alone. AdmissionRejected is only raised when
+    there are no spaCy terms to fall back on, or always with
+    `fallback_on_rejection=False` for callers that would rather wait and retry
+    than settle for spaCy terms. `sci_terms` skips the NER branch when it
+    already ran elsewhere, as in the batch runner.
     """
-    response = model.generate_content(prompt)
-    return response.text
+    if sci_terms is not None:
+        ner_branch = asyncio.sleep(0, result=sci_terms)
+    else:
+        ner_branch = asyncio.wait_for(extraction_service.extract(text), ner_timeout)
+    llm_branch = asyncio.wait_for(clarify_symptoms_async(text), llm_timeout)
+    sci_result, llm_result = await asyncio.gather(ner_branch, llm_branch, return_exceptions=True)
 
+    if isinstance(sci_result, BaseException):
+        print(f"spaCy extraction failed or timed out: {sci_result!r}")
+        sci_terms = []
+    else:
+        sci_terms = sci_result
 
-def hybrid_symptom_extraction(text):
-    sci_terms = extract_medical_terms(text)
-    print(sci_terms)
-    try:
-        llm_terms = eval(clarify_symptoms(text))  
-        print(llm_terms)
-    except:
+    if isinstance(llm_result, AdmissionRejected) and not (sci_terms and fallback_on_rejection):
+        raise llm_result  # nothing to fall back on; let the client retry later
+    if isinstance(llm_result, BaseException):
+        print(f"LLM extraction failed or timed out, using spaCy terms only: {llm_result!r}")
         llm_terms = []
-    
-    return list(set(sci_terms + llm_terms))  
+    else:
+        llm_terms = llm_result
 
+    # Canonical, sorted terms: same clinical picture -> same session symptoms and prompts
+    return symptom_index.normalize_terms(sci_terms + llm_terms)